@@ -0,0 +1,180 @@
+"""Adaptive sampling of one or more curves over a shared x grid.
+
+Starts from a coarse uniform grid and repeatedly bisects the segments where
+the curve bends away from a straight line, so smooth regions get few points
+and wiggly or steep ones get many, up to a point budget. Jumps and poles are
+located by bisection and split with a NaN so plots do not join across them.
+"""
+import numpy as np
+
+DEFAULT_INITIAL_POINTS = 65
+DEFAULT_MAX_POINTS = 4000
+# Allowed deviation from a straight segment, as a fraction of the visible y span
+DEFAULT_TOLERANCE = 1e-3
+# Segments narrower than this fraction of the range are never split further
+MIN_WIDTH_FRACTION = 1e-7
+# A segment whose rise exceeds this fraction of the y span is checked for a jump
+JUMP_THRESHOLD = 0.05
+JUMP_BISECTIONS = 24
+MAX_JUMP_CANDIDATES = 256
+
+
+def as_rows(y_vals, x_vals):
+    """Return sampled values as a 2D float array with one row per curve"""
+    y_vals = np.asarray(y_vals, dtype=float)
+    if y_vals.ndim < 2:
+        y_vals = y_vals.reshape(1, -1) if y_vals.ndim else y_vals.reshape(1, 1)
+    return np.broadcast_to(y_vals, (y_vals.shape[0], len(x_vals)))
+
+
+def view_window(y_vals):
+    """Return per-row (low, span) of the visible y range, shaped for broadcasting"""
+    low = np.zeros((y_vals.shape[0], 1))
+    span = np.ones((y_vals.shape[0], 1))
+    for row, values in enumerate(y_vals):
+        finite = values[np.isfinite(values)]
+        if len(finite) == 0:
+            continue
+        lo, hi = np.percentile(finite, [5, 95])
+        low[row] = lo
+        span[row] = hi - lo if hi > lo else max(abs(lo), 1.0)
+    return low, span
+
+
+def normalized(y_vals, low, span):
+    """Map y values into view units, clipped one span beyond the view"""
+    with np.errstate(invalid='ignore'):
+        return np.clip((y_vals - low) / span, -1.0, 2.0)
+
+
+def segment_errors(x_vals, y_norm):
+    """Return the refinement error of every segment, maximized over curves
+
+    The error of an interior point is its distance from the chord between its
+    neighbours; a segment takes the larger error of its two end points. A
+    segment with exactly one finite end point gets an infinite error so the
+    edge of the domain is located precisely.
+    """
+    finite = np.isfinite(y_norm)
+    y_filled = np.where(finite, y_norm, 0.0)
+
+    deviation = np.zeros_like(y_filled)
+    if len(x_vals) > 2:
+        left = x_vals[1:-1] - x_vals[:-2]
+        right = x_vals[2:] - x_vals[1:-1]
+        chord = (y_filled[:, :-2] * right + y_filled[:, 2:] * left) / (left + right)
+        deviation[:, 1:-1] = np.abs(y_filled[:, 1:-1] - chord)
+        # Points next to a gap have no meaningful chord
+        deviation[:, 1:-1] *= finite[:, :-2] & finite[:, 1:-1] & finite[:, 2:]
+
+    errors = np.maximum(deviation[:, :-1], deviation[:, 1:])
+    errors[finite[:, :-1] != finite[:, 1:]] = np.inf
+    return errors.max(axis=0)
+
+
+def find_jumps(sample, x_vals, y_vals, low, span):
+    """Locate jump discontinuities and poles between neighbouring samples
+
+    Every segment whose rise is large in view units is bisected towards the
+    half that keeps the larger rise. A continuous curve's rise shrinks as the
+    interval does; if it is still large after JUMP_BISECTIONS halvings the
+    curve is treated as discontinuous there. Returns (row, segment, x) tuples.
+    """
+    y_norm = normalized(y_vals, low, span)
+    with np.errstate(invalid='ignore'):
+        rise = np.abs(np.diff(y_norm, axis=1))
+    rows, segments = np.nonzero(rise > JUMP_THRESHOLD)
+    if len(rows) == 0:
+        return []
+    if len(rows) > MAX_JUMP_CANDIDATES:
+        keep = np.argsort(rise[rows, segments])[-MAX_JUMP_CANDIDATES:]
+        rows, segments = rows[keep], segments[keep]
+
+    a = x_vals[segments].copy()
+    b = x_vals[segments + 1].copy()
+    ya = y_norm[rows, segments].copy()
+    yb = y_norm[rows, segments + 1].copy()
+    for _ in range(JUMP_BISECTIONS):
+        mid = (a + b) / 2
+        ym = normalized(as_rows(sample(mid), mid), low, span)[rows, np.arange(len(mid))]
+        # A non-finite midpoint means a gap, which already breaks the line
+        gap = ~np.isfinite(ym)
+        left = np.abs(ym - ya) >= np.abs(yb - ym)
+        b = np.where(left, mid, b)
+        yb = np.where(left, ym, yb)
+        a = np.where(left, a, mid)
+        ya = np.where(left, ya, ym)
+        still_jumping = ~gap & (np.abs(yb - ya) > JUMP_THRESHOLD)
+        rows, segments, a, b, ya, yb = (v[still_jumping] for v in (rows, segments, a, b, ya, yb))
+        if len(rows) == 0:
+            return []
+
+    return list(zip(rows.tolist(), segments.tolist(), ((a + b) / 2).tolist()))
+
+
+def split_at_jumps(x_vals, y_vals, jumps):
+    """Insert a point at every jump, NaN for the jumping curve and interpolated for the others"""
+    if not jumps:
+        return x_vals, y_vals
+    jumps = sorted(jumps, key=lambda jump: jump[2])
+    positions = np.array([segment + 1 for _, segment, _ in jumps])
+    x_new = np.array([x for _, _, x in jumps])
+
+    # Linear interpolation within each segment for the unaffected curves
+    x0 = x_vals[positions - 1]
+    x1 = x_vals[positions]
+    t = (x_new - x0) / (x1 - x0)
+    y_new = y_vals[:, positions - 1] * (1 - t) + y_vals[:, positions] * t
+    for column, (row, _, _) in enumerate(jumps):
+        y_new[row, column] = np.nan
+
+    return np.insert(x_vals, positions, x_new), np.insert(y_vals, positions, y_new, axis=1)
+
+
+def adaptive_sample(sample, x_min, x_max, max_points=DEFAULT_MAX_POINTS,
+                    initial_points=DEFAULT_INITIAL_POINTS, tolerance=DEFAULT_TOLERANCE):
+    """Adaptively sample one or more curves on [x_min, x_max]
+
+    sample(x_vals) returns an array of values, or a sequence of arrays for
+    several curves; all curves share the returned x grid. Segments are split
+    where any curve deviates from a straight line by more than tolerance (in
+    fractions of its visible y span), largest errors first, until no segment
+    needs refining or max_points is reached.
+
+    Returns (x_vals, y_vals, discontinuities): y_vals has one row per curve
+    with NaN inserted at every jump or pole, and discontinuities lists the
+    x position of every jump for each row.
+    """
+    x_vals = np.linspace(x_min, x_max, min(initial_points, max_points))
+    y_vals = as_rows(sample(x_vals), x_vals)
+    low, span = view_window(y_vals)
+    min_width = (x_max - x_min) * MIN_WIDTH_FRACTION
+
+    while len(x_vals) < max_points:
+        errors = segment_errors(x_vals, normalized(y_vals, low, span))
+        errors[np.diff(x_vals) <= min_width] = 0
+        refine = np.flatnonzero(errors > tolerance)
+        if len(refine) == 0:
+            break
+        budget = max_points - len(x_vals)
+        if len(refine) > budget:
+            refine = np.sort(refine[np.argsort(errors[refine])[-budget:]])
+
+        x_new = (x_vals[refine] + x_vals[refine + 1]) / 2
+        y_new = as_rows(sample(x_new), x_new)
+        x_vals = np.insert(x_vals, refine + 1, x_new)
+        y_vals = np.insert(y_vals, refine + 1, y_new, axis=1)
+
+    jumps = find_jumps(sample, x_vals, y_vals, low, span)
+    discontinuities = [[] for _ in range(y_vals.shape[0])]
+    last_segment = {}
+    for row, segment, x in sorted(jumps, key=lambda jump: jump[2]):
+        if last_segment.get(row) == segment - 1:
+            # Jumping to an isolated sample and back (sign(x) at 0) is one discontinuity, at that sample
+            discontinuities[row][-1] = float(x_vals[segment])
+        else:
+            discontinuities[row].append(x)
+        last_segment[row] = segment
+
+    x_vals, y_vals = split_at_jumps(x_vals, np.array(y_vals), jumps)
+    return x_vals, y_vals, discontinuities
@@ -0,0 +1,106 @@
+"""Robust y-axis limits for one or more sampled curves.
+
+Each curve gets a (low, high) range from its 5th and 95th percentiles,
+found by selection (np.partition) rather than a full sort. Spikes around
+vertical asymptotes are detected and left out first, so a pole does not
+stretch the axis. The ranges of all visible curves are then combined and
+padded.
+"""
+import numpy as np
+
+LOW_QUANTILE = 0.05
+HIGH_QUANTILE = 0.95
+PADDING = 0.2
+# Samples this many interquartile ranges away from the median count as a spike
+OUTLIER_FACTOR = 10.0
+
+
+def quantiles(values, qs):
+    """Linearly interpolated quantiles of values (like np.percentile) in O(n) using np.partition"""
+    positions = np.asarray(qs, dtype=float) * (len(values) - 1)
+    lower = np.floor(positions).astype(int)
+    upper = np.minimum(lower + 1, len(values) - 1)
+    partitioned = np.partition(values, np.unique(np.concatenate((lower, upper))))
+    fraction = positions - lower
+    return partitioned[lower] * (1 - fraction) + partitioned[upper] * fraction
+
+
+def resample_evenly(x_vals, y_vals, keep):
+    """Values of y_vals[keep] weighted by the x spacing around each sample
+
+    The sample at or after each point of an evenly spaced grid over sorted
+    x_vals is picked, and picks outside keep are dropped, so densely refined
+    regions of an adaptive grid do not dominate statistics and the spans
+    of dropped samples carry no weight.
+    """
+    grid = np.linspace(x_vals[0], x_vals[-1], len(x_vals))
+    picks = np.minimum(np.searchsorted(x_vals, grid), len(x_vals) - 1)
+    picks = picks[keep[picks]]
+    return y_vals[picks] if len(picks) else y_vals[keep]
+
+
+def find_asymptotes(x_vals, y_vals, weighted=False):
+    """Locate spikes around vertical asymptotes
+
+    A spike is a run of samples far from the bulk of the curve (see
+    OUTLIER_FACTOR) that does not touch either end of the range; runs at the
+    ends are growth, as in e^x, rather than a pole. Returns (mask, positions):
+    mask marks the samples in spikes and positions is the x of the largest
+    |y| in each spike. With weighted=True the bulk is measured on
+    resample_evenly(), as adaptive grids crowd their samples near poles.
+    """
+    finite = np.isfinite(y_vals)
+    mask = np.zeros(len(y_vals), dtype=bool)
+    if np.count_nonzero(finite) < 4:
+        return mask, []
+    bulk = resample_evenly(x_vals, y_vals, finite) if weighted else y_vals[finite]
+    q1, median, q3 = quantiles(bulk, [0.25, 0.5, 0.75])
+    scale = q3 - q1 if q3 > q1 else max(abs(median), 1.0)
+    with np.errstate(invalid='ignore'):
+        outlying = np.abs(y_vals - median) > OUTLIER_FACTOR * scale
+
+    # Runs of outlying samples, allowing gaps (NaN) inside a run
+    candidate = (outlying | ~finite).astype(np.int8)
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], candidate, [0]))))
+    positions = []
+    for start, stop in zip(edges[::2], edges[1::2]):
+        if start == 0 or stop == len(y_vals) or not np.any(outlying[start:stop]):
+            continue
+        mask[start:stop] = True
+        run = np.where(finite[start:stop], np.abs(y_vals[start:stop]), -np.inf)
+        positions.append(float(x_vals[start + int(np.argmax(run))]))
+    return mask & finite, positions
+
+
+def robust_range(y_vals, x_vals, weighted=False):
+    """Return ((low, high), asymptotes) for one curve; the range is None if nothing is finite
+
+    With weighted=True (non-uniform grids) every sample counts in proportion
+    to the x spacing around it, so densely refined regions do not skew the
+    quantiles.
+    """
+    spikes, asymptotes = find_asymptotes(x_vals, y_vals, weighted)
+    keep = np.isfinite(y_vals) & ~spikes
+    if not np.any(keep):
+        return None, asymptotes
+
+    values = resample_evenly(x_vals, y_vals, keep) if weighted else y_vals[keep]
+    low, high = quantiles(values, [LOW_QUANTILE, HIGH_QUANTILE])
+    return (float(low), float(high)), asymptotes
+
+
+def combine(ranges, padding=PADDING):
+    """Padded (y_min, y_max) covering every range in ranges (None entries are skipped), or None"""
+    ranges = [r for r in ranges if r is not None]
+    if not ranges:
+        return None
+    low = min(r[0] for r in ranges)
+    high = max(r[1] for r in ranges)
+    y_padding = (high - low) * padding
+    y_min = low - y_padding
+    y_max = high + y_padding
+
+    # Only return limits if they're reasonable
+    if np.isfinite(y_min) and np.isfinite(y_max) and y_min < y_max:
+        return y_min, y_max
+    return None
@@ -0,0 +1,203 @@
+"""Evaluation backends for compiled sympy expressions.
+
+Every kernel is compiled with NumPy, which is always available and fastest
+for small inputs. numexpr (multi-threaded, evaluated in cache-sized blocks
+without full-size temporaries) and numba (parallel ufuncs) are used when
+installed. The first time a kernel is called on a large input, every
+available backend is timed on that input and checked against NumPy's
+result; the fastest one that agrees is used for large inputs from then on.
+"""
+import math
+import threading
+import time
+
+import mpmath
+import numpy as np
+import sympy as sp
+
+from profiling import count, stage
+
+
+def scalar_function(real, general):
+    """Scalar function using real (from math) for real arguments and general (from mpmath) otherwise
+
+    Returns NaN where the function is undefined (at the poles of gamma) and
+    inf where a real result overflows.
+    """
+    def apply(*args):
+        try:
+            if any(isinstance(arg, complex) for arg in args):
+                return complex(general(*args))
+            return float(real(*args))
+        except (ValueError, ZeroDivisionError):
+            return math.nan
+        except OverflowError:
+            return math.inf
+    return apply
+
+
+def elementwise(real, general, nin=1):
+    """NumPy function applying scalar_function(real, general) to every element
+
+    For the special functions NumPy lacks; much slower than a ufunc, but
+    only expressions using them pay for it.
+    """
+    func = np.frompyfunc(scalar_function(real, general), nin, 1)
+
+    def apply(*args):
+        values = func(*args)
+        if not isinstance(values, np.ndarray):
+            return values
+        return values.astype(complex if any(np.iscomplexobj(arg) for arg in args) else float)
+    return apply
+
+
+# Special functions the parser accepts but NumPy has no function for; polygamma
+# appears in the derivatives of gamma and factorial
+SPECIAL_FUNCTIONS = {
+    'gamma': elementwise(math.gamma, mpmath.gamma),
+    'factorial': elementwise(lambda value: math.gamma(value + 1), mpmath.factorial),
+    'erf': elementwise(math.erf, mpmath.erf),
+    'polygamma': elementwise(lambda order, value: mpmath.polygamma(order, value), mpmath.polygamma, nin=2),
+}
+LAMBDIFY_MODULES = ['numpy', {'log': np.log, 'ln': np.log, **SPECIAL_FUNCTIONS}]
+# Inputs smaller than this are always evaluated with NumPy; threads do not pay off below it
+MIN_POINTS = 50_000
+# Relative tolerance for a backend's result to count as agreeing with NumPy
+TOLERANCE = 1e-9
+
+# Name of the backend to use for every kernel instead of benchmarking, or None
+forced = None
+
+
+def available():
+    """Names of the usable backends, "numpy" first"""
+    names = ["numpy"]
+    for name in ("numexpr", "numba"):
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def compile_numpy(args, exprs):
+    return sp.lambdify(args, list(exprs), modules=LAMBDIFY_MODULES, cse=True)
+
+
+def compile_numexpr(args, exprs):
+    # sympy's numexpr printer handles one expression at a time
+    funcs = [sp.lambdify(args, expr, modules="numexpr") for expr in exprs]
+    return lambda *inputs: [func(*inputs) for func in funcs]
+
+
+def compile_numba(args, exprs):
+    import numba
+
+    signature = "float64(" + ", ".join(["float64"] * len(args)) + ")"
+    funcs = [numba.vectorize([signature], target="parallel")(sp.lambdify(args, expr, modules="math"))
+             for expr in exprs]
+    return lambda *inputs: [func(*inputs) for func in funcs]
+
+
+COMPILERS = {"numpy": compile_numpy, "numexpr": compile_numexpr, "numba": compile_numba}
+
+
+def agrees(expected, actual):
+    """Whether every output of a backend matches NumPy's, NaNs included"""
+    for want, got in zip(expected, actual):
+        want = np.asarray(want, dtype=float)
+        got = np.broadcast_to(np.asarray(got, dtype=float), want.shape)
+        with np.errstate(invalid='ignore'):
+            if not np.allclose(got, want, rtol=TOLERANCE, atol=0.0, equal_nan=True):
+                return False
+    return True
+
+
+class Kernel:
+    """Compiled expressions of args, returning a list with one value per expression
+
+    Called like a lambdify'd function. With single=True it returns the
+    only value instead of a list. Complex inputs always go to NumPy.
+    """
+
+    def __init__(self, args, exprs, single=False):
+        self.args = tuple(args)
+        self.exprs = list(exprs)
+        self.single = single
+        self.numpy = compile_numpy(self.args, self.exprs)
+        # Chosen on the first large call; "numpy" until then
+        self.backend = forced if forced in COMPILERS else None
+        self.fast = None
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, *inputs):
+        outputs = self.evaluate(inputs)
+        return outputs[0] if self.single else outputs
+
+    def evaluate(self, inputs):
+        if not self.large(inputs):
+            return self.numpy(*inputs)
+        with self._lock:
+            if self.backend is None:
+                return self.select(inputs)
+            if self.fast is None:
+                self.fast = self.compile(self.backend) or self.numpy
+        if self.fast is self.numpy:
+            return self.numpy(*inputs)
+        count("backend_" + self.backend)
+        return self.fast(*inputs)
+
+    def large(self, inputs):
+        """Whether inputs are real and broadcast to at least MIN_POINTS points"""
+        return (np.broadcast(*inputs).size >= MIN_POINTS
+                and not any(np.iscomplexobj(value) for value in inputs))
+
+    def choose(self, *inputs):
+        """Select the backend on inputs unless already selected; returns its name
+
+        Callers that split large inputs into blocks use this to decide the
+        block size. Returns "numpy" without selecting when inputs are small.
+        """
+        if self.backend is None and self.large(inputs):
+            with self._lock:
+                if self.backend is None:
+                    self.select(inputs)
+        return self.backend or "numpy"
+
+    def compile(self, name):
+        try:
+            return COMPILERS[name](self.args, self.exprs)
+        except Exception:
+            return None
+
+    def select(self, inputs):
+        """Time every available backend on inputs and keep the fastest that agrees with NumPy
+
+        Returns NumPy's outputs. Compilation (and numba's JIT on a tiny
+        input) is not part of the timing.
+        """
+        with stage("backend_selection"):
+            start = time.perf_counter()
+            expected = self.numpy(*inputs)
+            self.timings = {"numpy": time.perf_counter() - start}
+            self.backend, self.fast = "numpy", self.numpy
+            for name in available()[1:]:
+                func = self.compile(name)
+                if func is None:
+                    continue
+                try:
+                    func(*(np.ravel(value)[:2] if np.ndim(value) else value for value in inputs))
+                    start = time.perf_counter()
+                    outputs = func(*inputs)
+                    elapsed = time.perf_counter() - start
+                except Exception:
+                    continue
+                if not agrees(expected, outputs):
+                    continue
+                self.timings[name] = elapsed
+                if elapsed < self.timings[self.backend]:
+                    self.backend, self.fast = name, func
+            return expected
@@ -0,0 +1,248 @@
+"""Evaluate expression files without the GUI.
+
+Each input line is an expression, optionally followed by its range as
+"expression ; x_min ; x_max", or a JSON object with "expr" and optional
+"x_min", "x_max" and "operations" keys. Blank lines and lines starting with
+# are skipped. Expressions are processed on a process pool and results are
+streamed in input order as JSON lines, CSV or one .npy file per expression.
+
+    python batch.py expressions.txt --format csv -o table.csv
+    cat expressions.txt | python batch.py - --format npy -o tables/
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import calculus_engine
+
+FORMATS = ["jsonl", "csv", "npy"]
+
+
+class Job:
+    """One expression to evaluate, as read from the input"""
+
+    def __init__(self, index, expr, x_min, x_max, operations, error=None):
+        self.index = index
+        self.expr = expr
+        self.x_min = x_min
+        self.x_max = x_max
+        self.operations = operations
+        # Set when the input line itself could not be read
+        self.error = error
+
+
+def parse_line(line, index, defaults):
+    """Turn one input line into a Job, or None for blank and comment lines"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    x_min, x_max, operations = defaults
+    if line.startswith('{'):
+        record = json.loads(line)
+        if not isinstance(record.get("expr"), str):
+            raise ValueError(f"\"expr\" must be a string, got: {line}")
+        operations = record.get("operations", operations)
+        if not isinstance(operations, list) or not all(isinstance(operation, str) for operation in operations):
+            raise ValueError(f"\"operations\" must be a list of names, got: {line}")
+        unknown = set(operations) - set(calculus_engine.OPERATIONS)
+        if unknown:
+            raise ValueError("unknown operations: " + ", ".join(sorted(unknown)))
+        return Job(index, record["expr"], float(record.get("x_min", x_min)), float(record.get("x_max", x_max)),
+                   operations)
+
+    parts = [part.strip() for part in line.split(';')]
+    if len(parts) == 3:
+        return Job(index, parts[0], float(parts[1]), float(parts[2]), operations)
+    if len(parts) == 1:
+        return Job(index, parts[0], x_min, x_max, operations)
+    raise ValueError(f"Expected 'expression' or 'expression ; x_min ; x_max', got: {line}")
+
+
+def read_jobs(stream, defaults):
+    """Yield a Job per input line; unreadable lines become jobs that report the error"""
+    index = 0
+    for line in stream:
+        try:
+            job = parse_line(line, index, defaults)
+        except (ValueError, KeyError, TypeError) as e:
+            job = Job(index, line.strip(), None, None, (), error=str(e))
+        if job is not None:
+            yield job
+            index += 1
+
+
+def evaluate_job(job, options):
+    """Run the engine for one job in a worker process and return a picklable dict"""
+    record = {"index": job.index, "expr": job.expr, "x_min": job.x_min, "x_max": job.x_max}
+    if job.error is not None:
+        record["error"] = job.error
+        return record
+    try:
+        result = calculus_engine.calculate(job.expr, job.x_min, job.x_max, job.operations, **options)
+    except Exception as e:
+        record["error"] = str(e)
+        return record
+
+    record["x"] = result.x_vals
+    record["curves"] = {}
+    for operation, curve in result.curves.items():
+        record["curves"][operation] = {
+            "expr": str(curve.expr),
+            "y": curve.y_vals,
+            "error": None if curve.error is None else str(curve.error),
+            "error_estimate": curve.error_estimate
+        }
+    return record
+
+
+def json_values(values):
+    # JSON has no NaN or infinity
+    if values is None:
+        return None
+    return [v if math.isfinite(v) else None for v in values.tolist()]
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        if "x" in record:
+            record = dict(record, x=json_values(record["x"]), curves={
+                operation: dict(curve, y=json_values(curve["y"])) for operation, curve in record["curves"].items()})
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.stream.flush()
+
+
+class CsvWriter:
+    """One row per sample: index, expression, x and one column per operation"""
+
+    def __init__(self, stream, operations):
+        self.operations = [operation for operation in calculus_engine.OPERATIONS if operation in operations]
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["index", "expression", "x"] + self.operations)
+        self.stream = stream
+
+    def write(self, record):
+        if "x" not in record:
+            return
+        nan = np.full(len(record["x"]), np.nan)
+        columns = [record["curves"].get(operation, {}).get("y") for operation in self.operations]
+        columns = [nan if column is None else column for column in columns]
+        for row in zip(record["x"], *columns):
+            self.writer.writerow([record["index"], record["expr"]] + [repr(float(value)) for value in row])
+
+    def close(self):
+        self.stream.flush()
+
+
+class NpyWriter:
+    """One <index>.npy per expression, with x in row 0 and one row per operation
+
+    A manifest.jsonl next to them lists the expression, row order and
+    symbolic results of each file.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.manifest = open(os.path.join(directory, "manifest.jsonl"), "w", encoding="utf-8")
+
+    def write(self, record):
+        entry = {key: record[key] for key in ("index", "expr", "x_min", "x_max") if key in record}
+        if "x" in record:
+            operations = list(record["curves"])
+            rows = [record["x"]] + [np.full(len(record["x"]), np.nan) if record["curves"][op]["y"] is None
+                                    else record["curves"][op]["y"] for op in operations]
+            filename = f"{record['index']:05d}.npy"
+            np.save(os.path.join(self.directory, filename), np.vstack(rows))
+            entry.update(file=filename, rows=["x"] + operations, curves={
+                operation: {key: value for key, value in curve.items() if key != "y"}
+                for operation, curve in record["curves"].items()})
+        else:
+            entry["error"] = record["error"]
+        self.manifest.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.manifest.close()
+
+
+def make_writer(output_format, output, operations):
+    if output_format == "npy":
+        if output is None:
+            raise SystemExit("--format npy needs --output DIRECTORY")
+        return NpyWriter(output)
+    stream = sys.stdout if output in (None, '-') else open(output, "w", encoding="utf-8", newline="")
+    if output_format == "csv":
+        return CsvWriter(stream, operations)
+    return JsonLinesWriter(stream)
+
+
+def run(jobs, writer, options, workers=None, chunksize=16):
+    """Evaluate jobs on a process pool, writing results in input order; returns the number of failures"""
+    failures = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(evaluate_job, jobs, _repeat(options), chunksize=chunksize)
+        for record in results:
+            if "error" in record:
+                failures += 1
+            writer.write(record)
+    writer.close()
+    return failures
+
+
+def _repeat(value):
+    while True:
+        yield value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate functions, derivatives and integrals without the GUI")
+    parser.add_argument("input", help="file with one expression per line, or - for stdin")
+    parser.add_argument("-o", "--output", help="output file (jsonl/csv, default stdout) or directory (npy)")
+    parser.add_argument("-f", "--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--x-min", type=float, default=-10.0)
+    parser.add_argument("--x-max", type=float, default=10.0)
+    parser.add_argument("--operations", default=",".join(calculus_engine.OPERATIONS),
+                        help="comma separated subset of: " + ", ".join(calculus_engine.OPERATIONS))
+    parser.add_argument("--points", type=int, default=calculus_engine.DEFAULT_NUM_POINTS)
+    parser.add_argument("--sampling", choices=["uniform", "adaptive"], default="uniform")
+    parser.add_argument("--integral-mode", choices=calculus_engine.INTEGRAL_MODES, default="auto")
+    parser.add_argument("--integrate-timeout", type=float, default=None,
+                        help="seconds before an integral falls back to numeric integration")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    operations = [operation.strip() for operation in args.operations.split(',') if operation.strip()]
+    unknown = set(operations) - set(calculus_engine.OPERATIONS)
+    if unknown:
+        parser.error("unknown operations: " + ", ".join(sorted(unknown)))
+
+    options = {
+        "num_points": args.points,
+        "sampling": args.sampling,
+        "integral_mode": args.integral_mode,
+        "integrate_timeout": args.integrate_timeout
+    }
+    stream = sys.stdin if args.input == '-' else open(args.input, encoding="utf-8")
+    with stream:
+        jobs = read_jobs(stream, (args.x_min, args.x_max, operations))
+        writer = make_writer(args.format, args.output, operations)
+        failures = run(jobs, writer, options, args.workers)
+
+    if failures:
+        print(f"{failures} expression(s) failed", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
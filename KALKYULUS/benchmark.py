@@ -0,0 +1,243 @@
+"""Benchmark the parse -> differentiate -> integrate -> lambdify -> sample pipeline.
+
+Times every stage of what the grapher does for a corpus of representative
+expressions, from a cold sympy cache on each repetition, and reports
+percentiles plus peak memory per stage. Results can be saved as a baseline
+and later runs compared against it; comparisons use the fastest of the
+repetitions, after an untimed warmup run, which is far less noisy than the
+median.
+
+    python benchmark.py --save-baseline baseline.json
+    python benchmark.py --compare baseline.json
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from sympy.core.cache import clear_cache
+
+import autoscale
+import backends
+import calculus_engine
+import expression_parser
+from adaptive_sampling import adaptive_sample
+
+CORPUS = [
+    ("polynomial", "3x^5 - 2x^3 + x - 7"),
+    ("exp_cubic", "e^(x^3)"),
+    ("gaussian", "e^(-x^2)"),
+    ("nested_trig", "sin(cos(tan(x)))"),
+    ("trig_product", "sin(x)^2 cos(3x)"),
+    ("abs_bars", "|x^2 - 4| + |sin(x)|"),
+    ("log_rational", "ln(x^2 + 1)/(x - 2)"),
+    ("roots", "sqrt(x) + x^(1/3)"),
+    ("hard_integral", "sin(x) e^(-x^2)/(1 + x^4)")
+]
+
+# integrate_worker is the cost of integrating x with the timeout, i.e. of starting the
+# integration worker and collecting its result, which is also part of every integrate
+STAGES = ["parse", "differentiate", "integrate", "integrate_worker", "lambdify", "sample", "fused_lambdify",
+          "fused_sample", "adaptive_sample", "autoscale", "calculate_warm"]
+PERCENTILES = [50, 90, 100]
+# A stage is reported as a regression when its fastest run is this much slower than the
+# baseline's, and by more than either run's median exceeds its own fastest run (its noise)
+DEFAULT_THRESHOLD = 1.5
+# Slowdowns smaller than this many seconds are timer and scheduler noise
+MIN_SLOWDOWN = 1e-4
+# Fewer repetitions than this give too noisy a minimum to compare
+MIN_COMPARE_REPEATS = 5
+
+
+def run_pipeline(func_str, x_vals, integrate_timeout, measure):
+    """Run every stage once, passing each stage through measure(stage, func)"""
+    clear_cache()
+    expression_parser.clear_cache()
+    expr = measure("parse", lambda: calculus_engine.parse_function(func_str))
+    derivatives = measure("differentiate", lambda: calculus_engine.DerivativeTower(expr).up_to(3))
+    integral = measure("integrate", lambda: calculus_engine.integrate(expr, integrate_timeout))
+    measure("integrate_worker", lambda: calculus_engine.integrate(calculus_engine.x, integrate_timeout))
+    exprs = derivatives + [integral]
+
+    def compile_each():
+        callables = {}
+        for index, item in enumerate(exprs):
+            try:
+                callables[index] = calculus_engine.make_callable(item)
+            except Exception:
+                # Same as the grapher: an uncompilable curve is skipped
+                pass
+        return callables
+
+    def sample_each():
+        samples = {}
+        for index, func in callables.items():
+            try:
+                samples[index] = calculus_engine.evaluate(func, x_vals)
+            except Exception:
+                pass
+        return samples
+
+    callables = measure("lambdify", compile_each)
+    samples = measure("sample", sample_each)
+
+    # Fuse only the curves that compiled and evaluated on their own
+    working = [exprs[index] for index in samples]
+    fused = measure("fused_lambdify", lambda: calculus_engine.make_fused_callable(working))
+    measure("fused_sample", lambda: calculus_engine.evaluate_fused(fused, x_vals))
+    measure("adaptive_sample",
+            lambda: adaptive_sample(lambda points: calculus_engine.evaluate_fused(fused, points), x_vals[0], x_vals[-1]))
+    # As calculate() does: a robust range per curve, combined over all of them
+    measure("autoscale", lambda: autoscale.combine([autoscale.robust_range(y_vals, x_vals)[0]
+                                                    for y_vals in samples.values()]))
+
+    cache = calculus_engine.SymbolicCache()
+    calculus_engine.calculate(func_str, x_vals[0], x_vals[-1], calculus_engine.OPERATIONS[:4], cache=cache)
+    # Different range, so only the sampling is repeated
+    measure("calculate_warm", lambda: calculus_engine.calculate(func_str, x_vals[0] / 2, x_vals[-1] / 2,
+                                                                calculus_engine.OPERATIONS[:4], cache=cache))
+
+
+def time_stage(timings):
+    def measure(stage, func):
+        start = time.perf_counter()
+        value = func()
+        timings.setdefault(stage, []).append(time.perf_counter() - start)
+        return value
+    return measure
+
+
+def memory_stage(peaks):
+    def measure(stage, func):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        value = func()
+        _, peak = tracemalloc.get_traced_memory()
+        peaks[stage] = peak - start
+        return value
+    return measure
+
+
+def benchmark(corpus=CORPUS, repeats=5, num_points=calculus_engine.DEFAULT_NUM_POINTS, x_range=(-10.0, 10.0),
+              integrate_timeout=2.0, warmup=1):
+    """Benchmark every expression in corpus
+
+    Returns {name: {stage: {"min": s, "p50": s, "p90": s, "p100": s, "peak_kib": KiB}}}.
+    warmup untimed runs come first, so one-off costs (imports, starting the
+    integration worker's server, backend selection) are not timed. Timing
+    repetitions run without tracemalloc; peak memory comes from one extra
+    traced run.
+    """
+    x_vals = np.linspace(x_range[0], x_range[1], num_points)
+    results = {}
+    for name, func_str in corpus:
+        for _ in range(warmup):
+            run_pipeline(func_str, x_vals, integrate_timeout, lambda stage, func: func())
+        timings = {}
+        for _ in range(repeats):
+            run_pipeline(func_str, x_vals, integrate_timeout, time_stage(timings))
+
+        peaks = {}
+        tracemalloc.start()
+        try:
+            run_pipeline(func_str, x_vals, integrate_timeout, memory_stage(peaks))
+        finally:
+            tracemalloc.stop()
+
+        results[name] = {}
+        for stage in STAGES:
+            values = np.percentile(timings[stage], PERCENTILES)
+            stats = {"min": float(np.min(timings[stage]))}
+            stats.update({f"p{p}": float(v) for p, v in zip(PERCENTILES, values)})
+            stats["peak_kib"] = peaks[stage] / 1024
+            results[name][stage] = stats
+    return results
+
+
+def fastest(stats):
+    """Fastest run of a stage; baselines saved before it was recorded only have the median"""
+    return stats.get("min", stats["p50"])
+
+
+def format_results(results, baseline=None):
+    """Return a text table of times, with the ratio of fastest runs to baseline when given"""
+    lines = [f"{'expression':<15} {'stage':<16} {'min ms':>10} {'p50 ms':>10} {'p90 ms':>10} {'max ms':>10} "
+             f"{'peak KiB':>10}" + (f" {'vs base':>8}" if baseline else "")]
+    for name, stages in results.items():
+        for stage, stats in stages.items():
+            line = (f"{name:<15} {stage:<16} {stats['min'] * 1e3:>10.3f} {stats['p50'] * 1e3:>10.3f} "
+                    f"{stats['p90'] * 1e3:>10.3f} {stats['p100'] * 1e3:>10.3f} {stats['peak_kib']:>10.1f}")
+            base = (baseline or {}).get(name, {}).get(stage)
+            if base and fastest(base) > 0:
+                line += f" {stats['min'] / fastest(base):>7.2f}x"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def regressions(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return (name, stage, ratio) for every stage whose fastest run slowed down beyond the noise
+
+    A slowdown counts when the ratio of fastest runs exceeds threshold and
+    the spread (median / fastest) of both runs, and is at least MIN_SLOWDOWN.
+    """
+    found = []
+    for name, stages in results.items():
+        for stage, stats in stages.items():
+            base = baseline.get(name, {}).get(stage)
+            if not base or fastest(base) <= 0 or stats["min"] <= 0:
+                continue
+            ratio = stats["min"] / fastest(base)
+            noise = max(stats["p50"] / stats["min"], base["p50"] / fastest(base))
+            if ratio > max(threshold, noise) and stats["min"] - fastest(base) >= MIN_SLOWDOWN:
+                found.append((name, stage, ratio))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the calculus pipeline stage by stage")
+    parser.add_argument("--repeats", type=int, default=MIN_COMPARE_REPEATS)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed runs per expression before timing")
+    parser.add_argument("--points", type=int, default=calculus_engine.DEFAULT_NUM_POINTS)
+    parser.add_argument("--integrate-timeout", type=float, default=2.0)
+    parser.add_argument("--backend", choices=sorted(backends.COMPILERS),
+                        help="evaluate large inputs with this backend instead of the fastest one")
+    parser.add_argument("--only", help="comma separated corpus names to run")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="slowdown ratio of the fastest runs counted as a regression")
+    args = parser.parse_args(argv)
+    if args.compare and args.repeats < MIN_COMPARE_REPEATS:
+        parser.error(f"--compare needs at least {MIN_COMPARE_REPEATS} repeats")
+    backends.forced = args.backend
+
+    corpus = CORPUS
+    if args.only:
+        names = set(args.only.split(','))
+        corpus = [item for item in CORPUS if item[0] in names]
+
+    results = benchmark(corpus, args.repeats, args.points, integrate_timeout=args.integrate_timeout,
+                        warmup=args.warmup)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print(format_results(results, baseline))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({"repeats": args.repeats, "points": args.points, "results": results}, f, indent=2)
+
+    if baseline:
+        found = regressions(results, baseline, args.threshold)
+        for name, stage, ratio in found:
+            print(f"REGRESSION {name} {stage}: {ratio:.2f}x slower than baseline", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
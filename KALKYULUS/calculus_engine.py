@@ -0,0 +1,854 @@
+"""Headless calculus engine used by the function grapher.
+
+Parses function strings, computes derivatives and integrals with sympy and
+samples the results with NumPy. Nothing in here imports tkinter, ttkbootstrap
+or matplotlib, so it can be used without a display.
+"""
+import multiprocessing
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+
+from adaptive_sampling import DEFAULT_INITIAL_POINTS, adaptive_sample
+import autoscale
+import backends
+import critical_points
+import domain
+from calculus_operations import DERIVATIVE_ORDERS, INTEGRAL_MODES, LABELS, OPERATIONS
+from expression_parser import parse
+from numeric_integration import antiderivative
+from profiling import count, profiled, stage
+from symbolic_store import SymbolicStore
+
+x = sp.symbols('x')
+
+LAMBDIFY_MODULES = backends.LAMBDIFY_MODULES
+DEFAULT_NUM_POINTS = 1000
+DEFAULT_CACHE_SIZE = 128
+# Value of a free parameter (any symbol other than x) that has not been given one
+DEFAULT_PARAMETER_VALUE = 1.0
+# Sampled results kept per expression, e.g. for overlays and revisited views
+MAX_SAMPLE_SETS = 8
+# Imaginary parts this small relative to the real parts are rounding noise
+IMAGINARY_TOLERANCE = 1e-12
+
+
+def parse_function(func_str):
+    """Parse a user function string into a sympy expression, raising ParseError"""
+    with stage("parse"):
+        return parse(func_str)
+
+
+def simplify_step(expr):
+    """Cheap per-step simplification for the derivative tower
+
+    Distributes products over sums without expanding powers, logs or
+    multinomials, then pulls common factors such as exp(x**3) back out so
+    repeated differentiation grows one cofactor instead of the number of
+    terms. The result is only kept if it has fewer operations than expr.
+    """
+    candidate = sp.factor_terms(sp.expand(expr, power_base=False, power_exp=False, log=False, multinomial=False))
+    return candidate if sp.count_ops(candidate) < sp.count_ops(expr) else expr
+
+
+class DerivativeTower:
+    """Successive derivatives of an expression, each built from the one below it
+
+    tower[n] differentiates tower[n - 1] once instead of redoing all n orders
+    from the original expression. With simplify=True each new order is passed
+    through simplify_step before it is stored.
+    """
+
+    def __init__(self, expr, simplify=False, orders=None):
+        self.simplify = simplify
+        # orders may hold [f, f', ...] computed earlier, e.g. loaded from a SymbolicStore
+        self._orders = list(orders) if orders else [expr]
+        self._lock = threading.Lock()
+
+    def __getitem__(self, order):
+        if order < 0:
+            raise ValueError("Derivative order must be non-negative")
+        with self._lock:
+            while len(self._orders) <= order:
+                with stage("differentiate"):
+                    derivative = sp.diff(self._orders[-1], x)
+                    if self.simplify:
+                        derivative = simplify_step(derivative)
+                self._orders.append(derivative)
+            return self._orders[order]
+
+    def up_to(self, order):
+        """Return [f, f', ..., f^(order)]"""
+        self[order]
+        return self._orders[:order + 1]
+
+    def computed(self):
+        """Return the orders computed so far"""
+        with self._lock:
+            return list(self._orders)
+
+    def __len__(self):
+        """Number of orders computed so far, including the original expression"""
+        return len(self._orders)
+
+
+def _integrate_worker(expr, connection):
+    # Tell the parent the worker is up, so starting it does not count against the timeout
+    connection.send(None)
+    connection.send(sp.integrate(expr, x))
+
+
+def integrate_context():
+    """Multiprocessing context for the integration worker
+
+    Forking this process is unsafe once it runs threads (the grapher's
+    workers, Tk) and on macOS, so Linux forks from a forkserver that has
+    preloaded this module and sympy, and elsewhere workers are spawned.
+    """
+    if sys.platform.startswith("linux"):
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def integrate(expr, timeout=None):
+    """Return the antiderivative of expr, or an unevaluated sp.Integral on timeout
+
+    With a timeout the integration runs in a child process, which is
+    terminated if it has not finished after timeout seconds; a thread could
+    not be stopped. The timeout starts once the child is running.
+    """
+    with stage("integrate"):
+        return _integrate(expr, timeout)
+
+
+def _integrate(expr, timeout):
+    if timeout is None:
+        return sp.integrate(expr, x)
+
+    context = integrate_context()
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_integrate_worker, args=(expr, sender), daemon=True)
+    process.start()
+    sender.close()
+    try:
+        receiver.recv()
+        if receiver.poll(timeout):
+            return receiver.recv()
+    except EOFError:
+        # The child died without sending a result
+        pass
+    finally:
+        process.terminate()
+        process.join()
+        receiver.close()
+    return sp.Integral(expr, x)
+
+
+def free_parameters(expr):
+    """Return the symbols of expr other than x, sorted by name"""
+    return tuple(sorted(expr.free_symbols - {x}, key=str))
+
+
+def make_callable(expr, parameters=()):
+    """Compile a sympy expression into a function of x followed by parameters
+
+    Large inputs are evaluated with the fastest installed backend (see backends.py).
+    """
+    with stage("lambdify"):
+        return backends.Kernel((x,) + tuple(parameters), [expr], single=True)
+
+
+def make_fused_callable(exprs, parameters=()):
+    """Compile several sympy expressions into one NumPy function of x followed by parameters
+
+    Common subexpressions across all of exprs are eliminated with sp.cse, so
+    something like exp(x**3) shared by f and its derivatives is computed once
+    per call. The function returns one value per expression.
+    """
+    with stage("lambdify"):
+        return backends.Kernel((x,) + tuple(parameters), exprs)
+
+
+def as_samples(y_vals, x_vals):
+    """Return y_vals as a float array with the shape of x_vals, or a complex one if x_vals is complex"""
+    # Constant expressions come back as scalars
+    dtype = complex if np.iscomplexobj(x_vals) else float
+    return np.broadcast_to(np.asarray(y_vals, dtype=dtype), x_vals.shape)
+
+
+def evaluate(func, x_vals, values=()):
+    """Evaluate a compiled function over x_vals as a float array of the same shape
+
+    values are passed as the parameters after x.
+    """
+    with stage("evaluate"), np.errstate(all='ignore'):
+        return as_samples(func(x_vals, *values), x_vals)
+
+
+def evaluate_fused(func, x_vals, values=()):
+    """Evaluate a fused function over x_vals, returning one float array per output"""
+    with stage("evaluate"), np.errstate(all='ignore'):
+        return [as_samples(y_vals, x_vals) for y_vals in func(x_vals, *values)]
+
+
+class Curve:
+    """A single computed operation: its symbolic result and sampled values"""
+
+    def __init__(self, operation, expr, y_vals=None, error=None, discontinuities=(), error_estimate=None,
+                 imag_vals=None):
+        self.operation = operation
+        self.label = LABELS[operation]
+        self.expr = expr
+        self.y_vals = y_vals
+        # Imaginary parts in complex mode (y_vals then holds the real parts); None if all zero
+        self.imag_vals = imag_vals
+        self.error = error
+        self.discontinuities = list(discontinuities)
+        # Only set for curves computed numerically
+        self.error_estimate = error_estimate
+        # Robust (low, high) of the values and x positions of vertical asymptotes, set by calculate()
+        self.y_range = None
+        self.asymptotes = []
+
+    @property
+    def numeric(self):
+        return self.error_estimate is not None
+
+    @property
+    def mask(self):
+        return np.isfinite(self.y_vals)
+
+    @property
+    def plot_values(self):
+        """y values with every non-finite entry as NaN, so plotted lines break there"""
+        return np.where(self.mask, self.y_vals, np.nan)
+
+    @property
+    def plot_imag_values(self):
+        return np.where(np.isfinite(self.imag_vals), self.imag_vals, np.nan)
+
+
+class CalculationResult:
+    """Everything calculate() produced for one function string and range"""
+
+    def __init__(self, func_str, expr, x_vals, curves, y_limits, parameters=None, features=None, domain=None,
+                 complex_mode=False):
+        self.func_str = func_str
+        self.expr = expr
+        self.x_vals = x_vals
+        self.curves = curves
+        self.y_limits = y_limits
+        # Parameter name -> value the curves were computed with
+        self.parameters = parameters or {}
+        # Roots, extrema and inflection points of f (see critical_points.analyze), if requested
+        self.features = features
+        # Real domain of f as (start, end, left_open, right_open) intervals, None if unknown
+        self.domain = domain
+        self.complex_mode = complex_mode
+        self._limits = {}
+
+    def limits(self, operations):
+        """Padded y limits covering the given operations' curves, or None
+
+        Built from each curve's precomputed range and remembered per set of
+        operations, so toggling curves is cheap and gives the same axes each
+        time.
+        """
+        key = frozenset(operations)
+        if key not in self._limits:
+            self._limits[key] = autoscale.combine(
+                [self.curves[operation].y_range for operation in key if operation in self.curves])
+        return self._limits[key]
+
+
+def normalize(func_str):
+    """Normalize a function string for use as a cache key
+
+    Whitespace around operators and brackets is dropped and other runs of
+    whitespace collapse to one space, since "sin x" and "sinx" differ under
+    implicit multiplication.
+    """
+    return re.sub(r"\s*([^\w\s.])\s*", r"\1", " ".join(func_str.split()))
+
+
+class SymbolicEntry:
+    """Parsed expression for one function string plus its lazily computed results
+
+    Derivatives, the antiderivative and their compiled callables are computed
+    on first use and kept, so replotting the same function over a different
+    range only repeats the NumPy evaluation. Symbols other than x stay
+    symbolic as parameters; the callables take their values after x, so
+    changing a parameter also only repeats the evaluation.
+
+    record, as returned by record(), restores the symbolic results of an
+    earlier session without parsing or differentiating again.
+    """
+
+    def __init__(self, func_str, simplify=False, record=None):
+        self.func_str = func_str
+        self.simplify = simplify
+        if record is None:
+            self.expr = parse_function(func_str)
+            self.derivatives = DerivativeTower(self.expr, simplify)
+            self._integral = None
+        else:
+            self.expr = record["derivatives"][0]
+            self.derivatives = DerivativeTower(self.expr, simplify, record["derivatives"])
+            self._integral = record["integral"]
+        self.parameters = free_parameters(self.expr)
+        # An integral that timed out may succeed with a longer timeout, so it is not worth keeping
+        self._integral_final = self._integral is not None
+        # Timeout that produced a non-final integral; a call allowing longer tries again
+        self._integral_timeout = None
+        # Computed on first use; None is a valid domain (unknown), hence the flag
+        self._domain_known = record is not None and "domain" in record
+        self._domain = record.get("domain") if record is not None else None
+        # What the last record() covered, so unchanged entries are not written again
+        self._recorded = (len(self.derivatives), self._integral_final, self._domain_known)
+        self._callables = {}
+        self._fused = {}
+        self._samples = OrderedDict()
+        # Separate locks so a slow integral does not hold up the derivatives
+        self._lock = threading.RLock()
+        self._integral_lock = threading.Lock()
+
+    def integral(self, timeout=None):
+        """Return the antiderivative, computing it once
+
+        If it does not finish within timeout seconds an unevaluated
+        sp.Integral is stored and returned instead. That result is only
+        kept until a call with no timeout or a longer one, which computes
+        the integral again.
+        """
+        with self._integral_lock:
+            if self._integral is None or not self._integral_final and (
+                    timeout is None or timeout > self._integral_timeout):
+                retry = self._integral is not None
+                self._integral = integrate(self.expr, timeout)
+                self._integral_final = timeout is None or not self._integral.has(sp.Integral)
+                self._integral_timeout = None if self._integral_final else timeout
+                if retry:
+                    self.forget_integral_kernels()
+            return self._integral
+
+    def forget_integral_kernels(self):
+        """Drop compiled functions built from an earlier integral"""
+        with self._lock:
+            self._callables.pop("integral", None)
+            for operations in [operations for operations in self._fused if "integral" in operations]:
+                del self._fused[operations]
+
+    def domain(self):
+        """Return the real domain of the expression (see domain.real_domain), computing it once"""
+        with self._lock:
+            if not self._domain_known:
+                with stage("domain"):
+                    self._domain = domain.real_domain(self.expr, x)
+                self._domain_known = True
+            return self._domain
+
+    def domain_pieces(self, x_min, x_max, values=(), num_points=DEFAULT_NUM_POINTS):
+        """Return (pieces, intervals) for sampling [x_min, x_max] where f is real
+
+        pieces are the (start, end) pieces of the range to sample, or None to
+        sample it all; an empty list means f is real nowhere on the range.
+        intervals is the domain as known for this call, or None if unknown.
+        A symbolic domain that disagrees with samples of f on this range is
+        not used for it. Open ends are moved inside by a fraction of the step
+        of num_points evenly spaced points.
+        """
+        intervals = self.domain()
+        if intervals is None:
+            return None, None
+        pieces = domain.clip(intervals, x_min, x_max, (x_max - x_min) / (num_points - 1))
+        if domain.covers(pieces, x_min, x_max):
+            return None, intervals
+        original = self.callable("original")
+        with stage("domain"):
+            # Probed outside the exact interval ends, as f is real between them and the moved ends
+            exact = domain.clip(intervals, x_min, x_max, 0.0)
+            if not domain.consistent(lambda points: original(points, *values), exact, x_min, x_max):
+                # sympy's answer looks wrong here (e.g. one period of a periodic domain); sample it all
+                return None, None
+        return pieces, intervals
+
+    def result(self, operation):
+        """Return the sympy expression for operation, computing it once
+
+        operation is a name from OPERATIONS or an integer derivative order.
+        The integral is the one last computed by integral(), which is only
+        called here, without a timeout, if it never was.
+        """
+        if operation == "integral":
+            integral = self._integral
+            return self.integral() if integral is None else integral
+        return self.derivatives[DERIVATIVE_ORDERS.get(operation, operation)]
+
+    def prepare(self, operations):
+        """Compute the symbolic results of operations before compiling them under the lock
+
+        Failures are left for compilation to record.
+        """
+        for operation in operations:
+            try:
+                self.result(operation)
+            except Exception:
+                pass
+
+    def callable(self, operation):
+        """Return the compiled NumPy function for operation, compiling it once
+
+        A failure to compile is remembered and raised again on later calls.
+        """
+        key = DERIVATIVE_ORDERS.get(operation, operation)
+        if key not in self._callables:
+            self.prepare([key])
+        with self._lock:
+            if key not in self._callables:
+                try:
+                    self._callables[key] = (make_callable(self.result(key), self.parameters), None)
+                except Exception as e:
+                    self._callables[key] = (None, e)
+            func, error = self._callables[key]
+        if error is not None:
+            raise error
+        return func
+
+    def fused_callable(self, operations):
+        """Return a fused function covering operations, compiling it once
+
+        Returns (func, fused_operations, errors). If the operations cannot all
+        be compiled together, func only covers the ones that compile on their
+        own, listed in fused_operations; errors maps the rest to the compile
+        error. func is None if nothing compiles.
+        """
+        operations = tuple(operations)
+        if operations not in self._fused:
+            self.prepare(operations)
+        with self._lock:
+            count("kernel_hits" if operations in self._fused else "kernel_misses")
+            if operations not in self._fused:
+                try:
+                    self._fused[operations] = (make_fused_callable((self.result(op) for op in operations),
+                                                                   self.parameters), operations, {})
+                except Exception:
+                    errors = {}
+                    for operation in operations:
+                        try:
+                            self.callable(operation)
+                        except Exception as e:
+                            errors[operation] = e
+                    fused_operations = tuple(op for op in operations if op not in errors)
+                    func = (make_fused_callable((self.result(op) for op in fused_operations), self.parameters)
+                            if fused_operations else None)
+                    self._fused[operations] = (func, fused_operations, errors)
+            return self._fused[operations]
+
+
+    def record(self, changed_only=False):
+        """Return the symbolic results as a picklable dict, or None if changed_only and nothing is new
+
+        The dict holds the computed derivatives (the original expression
+        first), the antiderivative, which is None if it has not been
+        computed or timed out, and the domain once it is known.
+        """
+        with self._integral_lock:
+            integral = self._integral if self._integral_final else None
+        derivatives = self.derivatives.computed()
+        state = (len(derivatives), integral is not None, self._domain_known)
+        if changed_only and all(new <= old for new, old in zip(state, self._recorded)):
+            return None
+        self._recorded = state
+        record = {"derivatives": derivatives, "integral": integral}
+        if self._domain_known:
+            record["domain"] = self._domain
+        return record
+
+    def cached_result(self, key):
+        """Return the CalculationResult stored under key, or None"""
+        with self._lock:
+            result = self._samples.get(key)
+            count("result_hits" if result is not None else "result_misses")
+            if result is not None:
+                self._samples.move_to_end(key)
+            return result
+
+    def store_result(self, key, result):
+        """Keep result for key, dropping the least recently used beyond MAX_SAMPLE_SETS"""
+        with self._lock:
+            self._samples[key] = result
+            self._samples.move_to_end(key)
+            while len(self._samples) > MAX_SAMPLE_SETS:
+                self._samples.popitem(last=False)
+
+
+class SymbolicCache:
+    """Bounded LRU cache of SymbolicEntry objects keyed on the normalized function string
+
+    With a store (a symbolic_store.SymbolicStore) misses are looked up on
+    disk before parsing, and persist() writes new symbolic results back, so
+    they survive between sessions.
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, simplify_derivatives=False, store=None):
+        self.maxsize = maxsize
+        self.simplify_derivatives = simplify_derivatives
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def open_store(self, path=None):
+        """Attach a SymbolicStore at path (the user's cache directory by default) unless one is attached"""
+        with self._lock:
+            if self.store is None:
+                self.store = SymbolicStore(path)
+            return self.store
+
+    def get(self, func_str):
+        """Return the entry for func_str, parsing it on a miss"""
+        key = normalize(func_str)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                count("symbolic_hits")
+                self._entries.move_to_end(key)
+                return entry
+            self.misses += 1
+            count("symbolic_misses")
+
+        # Load or parse outside the lock; a parse error is not cached
+        entry = self.load(key)
+        if entry is None:
+            entry = SymbolicEntry(key, self.simplify_derivatives)
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def load(self, key):
+        """Return an entry restored from the store, or None"""
+        if self.store is None:
+            return None
+        with stage("store"):
+            record = self.store.load(key, sp.__version__, self.simplify_derivatives)
+            count("store_hits" if record is not None else "store_misses")
+            if record is None:
+                return None
+            entry = SymbolicEntry(key, self.simplify_derivatives, record)
+            # Nothing new to write back until more is computed
+            entry.record()
+            return entry
+
+    def persist(self, entry):
+        """Write the symbolic results of entry to the store if anything was computed since the last write"""
+        if self.store is None:
+            return
+        with stage("store"):
+            record = entry.record(changed_only=True)
+            if record is not None:
+                self.store.save(entry.func_str, sp.__version__, record, entry.simplify)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._entries), "maxsize": self.maxsize}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared cache used by calculate() unless another one is passed in
+symbolic_cache = SymbolicCache()
+
+
+def sample_separately(entry, operations, x_vals, values=()):
+    """Evaluate each operation with its own callable; returns (samples, errors)
+
+    values are the values of entry.parameters.
+    """
+    samples = {}
+    errors = {}
+    for operation in operations:
+        try:
+            samples[operation] = evaluate(entry.callable(operation), x_vals, values)
+        except Exception as e:
+            errors[operation] = e
+    return samples, errors
+
+
+def sample_fused(entry, operations, x_vals, values=()):
+    """Evaluate all operations in one pass of a fused kernel; returns (samples, errors)
+
+    Falls back to sample_separately if the fused kernel fails to run.
+    """
+    func, fused_operations, errors = entry.fused_callable(operations)
+    if func is None:
+        return {}, dict(errors)
+    try:
+        samples = dict(zip(fused_operations, evaluate_fused(func, x_vals, values)))
+    except Exception:
+        return sample_separately(entry, operations, x_vals, values)
+    return samples, dict(errors)
+
+
+def find_features(entry, x_vals, samples, sampler, values=()):
+    """Roots, extrema and inflection points of entry's function from its samples on x_vals
+
+    f' and f'' are sampled on x_vals if samples lacks them; the compiled first
+    to third derivatives serve as the Newton derivatives.
+    """
+    analysed = ["original", "first_derivative", "second_derivative"]
+    missing = [operation for operation in analysed if operation not in samples]
+    samples = dict(samples, **sampler(entry, missing, x_vals, values)[0]) if missing else samples
+
+    funcs = {}
+    for operation in analysed + ["third_derivative"]:
+        try:
+            compiled = entry.callable(operation)
+        except Exception:
+            # An uncompilable derivative only means bisection, or no extrema/inflections
+            funcs[operation] = None
+            continue
+        funcs[operation] = lambda points, compiled=compiled: evaluate(compiled, points, values)
+    return critical_points.analyze(x_vals, samples, funcs)
+
+
+def calculate(func_str, x_min, x_max, operations=("original",), num_points=DEFAULT_NUM_POINTS, cache=None,
+              fused=True, sampling="uniform", integrate_timeout=None, integral_mode="auto",
+              integral_method="simpson", integral_anchor=None, parameters=None, analysis=False,
+              complex_mode=False, profile=None):
+    """Parse func_str, apply the requested operations and sample them on [x_min, x_max]
+
+    Symbolic work is looked up in cache (the shared symbolic_cache by
+    default), so only the sampling is repeated for a known function, and
+    the last few sampled results of each function are kept as well. If the
+    cache has a store, new symbolic results are written to it. The
+    returned arrays may be shared and must not be modified. With
+    fused=True all curves are computed by a single CSE'd kernel, otherwise
+    each curve is evaluated on its own.
+
+    sampling="uniform" evaluates num_points evenly spaced points, while
+    sampling="adaptive" refines a shared grid where the curves bend, using at
+    most num_points points, and records jumps and poles on each Curve.
+
+    integral_mode chooses how the integral curve is produced: "symbolic"
+    only uses sp.integrate, "numeric" skips it and integrates the samples of
+    the original function with integral_method ("simpson" or "trapezoid"),
+    and "auto" uses the closed form unless sp.integrate times out after
+    integrate_timeout seconds, returns an unevaluated integral, or its result
+    cannot be compiled or evaluated. Numeric integrals are zero at
+    integral_anchor (x_min by default) and carry an error estimate.
+
+    The original function is always evaluated, as adaptive refinement and
+    numeric integrals rely on it; a failure there raises. Failures evaluating
+    any other operation are recorded on its Curve instead. result.y_limits
+    covers all requested curves; result.limits() gives them for a subset.
+
+    parameters maps the names of free parameters (symbols other than x) to
+    their values; missing ones are DEFAULT_PARAMETER_VALUE and unknown names
+    are ignored. The result lists the values used.
+
+    With analysis=True the roots, extrema and inflection points of f on the
+    range are located from the samples of f, f' and f'' and stored in
+    result.features; derivatives that were not requested are sampled for
+    this but not returned as curves.
+
+    Points are only sampled where f is real: when sympy can state the
+    domain of f as intervals, the range is restricted to them (with NaN gap
+    points in between) and result.domain lists them. A ValueError is raised
+    if f is real nowhere on the range. With complex_mode=True the whole
+    range is sampled uniformly with complex arithmetic instead; every
+    curve's y_vals holds the real parts and imag_vals the imaginary parts,
+    and analysis is skipped.
+
+    If profile (a profiling.Profile) is given, the time spent in every stage
+    and the cache hits of this call are recorded in it.
+    """
+    with profiled(profile):
+        return _calculate(func_str, x_min, x_max, operations, num_points, cache, fused, sampling,
+                          integrate_timeout, integral_mode, integral_method, integral_anchor, parameters or {},
+                          analysis, complex_mode)
+
+
+def missing_closed_form(entry, timeout):
+    """The error recorded on a symbolic integral curve when sympy gives no closed form"""
+    if timeout is not None and not entry._integral_final:
+        return TimeoutError(f"No closed-form integral found within {timeout:g} s")
+    return ValueError("sympy found no closed-form integral")
+
+
+def sample_pieces(sample_rows, pieces, num_points, rows):
+    """Adaptively sample every piece of the domain with its share of num_points
+
+    The pieces are joined by a gap point with NaN in every row. Returns
+    (x_vals, y_vals, discontinuities) like adaptive_sample.
+    """
+    x_parts, y_parts = [], []
+    discontinuities = [[] for _ in range(rows)]
+    for i, ((a, b), points) in enumerate(zip(pieces, domain.split_points(pieces, num_points))):
+        if i:
+            x_parts.append([(pieces[i - 1][1] + a) / 2])
+            y_parts.append(np.full((rows, 1), np.nan))
+        x_part, y_part, jumps = adaptive_sample(sample_rows, a, b, max_points=points)
+        x_parts.append(x_part)
+        y_parts.append(y_part)
+        for row, positions in enumerate(jumps):
+            discontinuities[row].extend(positions)
+    return np.concatenate(x_parts), np.concatenate(y_parts, axis=1), discontinuities
+
+
+def complex_antiderivative(x_vals, y_vals, method, anchor, func):
+    """antiderivative() of complex samples, integrating real and imaginary parts separately"""
+    real, real_error = antiderivative(x_vals, y_vals.real, method, anchor, lambda points: func(points).real)
+    imag, imag_error = antiderivative(x_vals, y_vals.imag, method, anchor, lambda points: func(points).imag)
+    return real + 1j * imag, max(real_error, imag_error)
+
+
+def split_complex(y_vals):
+    """Return (real, imag) of complex samples; imag is None if it is only rounding noise"""
+    if y_vals is None:
+        return None, None
+    real, imag = y_vals.real.copy(), y_vals.imag.copy()
+    finite = np.isfinite(real) & np.isfinite(imag)
+    scale = max(float(np.max(np.abs(real[finite]), initial=0.0)), 1.0)
+    if np.all(np.abs(imag[finite]) <= IMAGINARY_TOLERANCE * scale):
+        return real, None
+    # A value is only defined where both parts are
+    real[~finite] = np.nan
+    imag[~finite] = np.nan
+    return real, imag
+
+
+def _calculate(func_str, x_min, x_max, operations, num_points, cache, fused, sampling, integrate_timeout,
+               integral_mode, integral_method, integral_anchor, parameters, analysis, complex_mode):
+    if x_min >= x_max:
+        raise ValueError("X min must be less than X max")
+    if sampling not in ("uniform", "adaptive"):
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    if integral_mode not in INTEGRAL_MODES:
+        raise ValueError(f"Unknown integral mode: {integral_mode}")
+
+    # An empty cache is falsy (it has a length), so test for None
+    cache = symbolic_cache if cache is None else cache
+    entry = cache.get(func_str)
+    sampler = sample_fused if fused else sample_separately
+
+    requested = [operation for operation in OPERATIONS if operation in operations]
+    values = tuple(float(parameters.get(str(symbol), DEFAULT_PARAMETER_VALUE)) for symbol in entry.parameters)
+    if complex_mode:
+        sampling = "uniform"
+        analysis = False
+    key = (tuple(requested), float(x_min), float(x_max), num_points, fused, sampling,
+           integrate_timeout, integral_mode, integral_method, integral_anchor, values, analysis, complex_mode)
+    cached = entry.cached_result(key)
+    if cached is not None:
+        return cached
+
+    numeric_integral = "integral" in requested and integral_mode == "numeric"
+    integral_error = None
+    if "integral" in requested and integral_mode != "numeric" and entry.integral(integrate_timeout).has(sp.Integral):
+        if integral_mode == "auto":
+            numeric_integral = True
+        else:
+            integral_error = missing_closed_form(entry, integrate_timeout)
+    evaluated = ["original"] + [operation for operation in requested if operation != "original" and not (
+        operation == "integral" and (numeric_integral or integral_error is not None))]
+    pieces, intervals = (None, None) if complex_mode else entry.domain_pieces(x_min, x_max, values, num_points)
+    if pieces == []:
+        raise ValueError(f"f(x) = {func_str} is not real anywhere on [{x_min:g}, {x_max:g}] "
+                         f"(domain {domain.describe(intervals)})")
+
+    initial_points = num_points if sampling == "uniform" else min(DEFAULT_INITIAL_POINTS, num_points)
+    if pieces is None:
+        x_vals = np.linspace(x_min, x_max, initial_points)
+        samples, errors = sampler(entry, evaluated, x_vals + 0j if complex_mode else x_vals, values)
+    else:
+        # Points outside the domain are never evaluated
+        x_vals, valid = domain.grid(pieces, initial_points)
+        samples, errors = sampler(entry, evaluated, x_vals[valid], values)
+        samples = {operation: domain.scatter(y_vals, valid) for operation, y_vals in samples.items()}
+    if "original" in errors:
+        raise errors["original"]
+    if integral_error is not None:
+        errors["integral"] = integral_error
+
+    discontinuities = {}
+    if sampling == "adaptive":
+        # Refine using only the operations that evaluated on the initial grid
+        sampled = [operation for operation in evaluated if operation in samples]
+
+        def sample_rows(points):
+            rows = sampler(entry, sampled, points, values)[0]
+            return [rows.get(operation, np.full(points.shape, np.nan)) for operation in sampled]
+
+        with stage("adaptive_sampling"):
+            if pieces is None:
+                x_vals, rows, jumps = adaptive_sample(sample_rows, x_min, x_max, max_points=num_points)
+            else:
+                x_vals, rows, jumps = sample_pieces(sample_rows, pieces, num_points, len(sampled))
+        samples = dict(zip(sampled, rows))
+        discontinuities = dict(zip(sampled, jumps))
+
+    # Closed forms that fail to compile or evaluate also fall back in auto mode
+    if "integral" in errors and integral_mode == "auto":
+        del errors["integral"]
+        numeric_integral = True
+
+    error_estimates = {}
+    integral_expr = None
+    if numeric_integral:
+        with stage("numeric_integral"):
+            original = entry.callable("original")
+            integrate_samples = complex_antiderivative if complex_mode else antiderivative
+            samples["integral"], error_estimates["integral"] = integrate_samples(
+                x_vals, samples["original"], integral_method, integral_anchor,
+                lambda points: original(points + 0j if complex_mode else points, *values))
+        discontinuities["integral"] = discontinuities.get("original", ())
+        if integral_mode == "numeric":
+            integral_expr = sp.Integral(entry.expr, x)
+
+    curves = {}
+    for operation in requested:
+        expr = integral_expr if operation == "integral" and integral_expr is not None else entry.result(operation)
+        y_vals, imag_vals = split_complex(samples.get(operation)) if complex_mode else (samples.get(operation), None)
+        curves[operation] = Curve(operation, expr, y_vals, errors.get(operation),
+                                  discontinuities.get(operation, ()), error_estimates.get(operation), imag_vals)
+
+    features = None
+    if analysis:
+        with stage("analysis"):
+            features = find_features(entry, x_vals, samples, sampler, values)
+
+    with stage("autoscale"):
+        for curve in curves.values():
+            if curve.error is None and curve.y_vals is not None:
+                curve.y_range, curve.asymptotes = autoscale.robust_range(curve.y_vals, x_vals, sampling == "adaptive")
+                if curve.imag_vals is not None:
+                    imag_range, _ = autoscale.robust_range(curve.imag_vals, x_vals)
+                    ranges = [r for r in (curve.y_range, imag_range) if r is not None]
+                    curve.y_range = (min(r[0] for r in ranges), max(r[1] for r in ranges)) if ranges else None
+    result = CalculationResult(func_str, entry.expr, x_vals, curves, None,
+                               dict(zip(map(str, entry.parameters), values)), features,
+                               None if complex_mode else intervals, complex_mode)
+    # Limits over every requested curve, so derivatives and integrals are not clipped
+    result.y_limits = result.limits(requested)
+    entry.store_result(key, result)
+    cache.persist(entry)
+    return result
@@ -0,0 +1,33 @@
+"""Names and labels of the calculus operations.
+
+Kept free of sympy and NumPy so the GUI can build its controls before the
+engine is imported.
+"""
+
+# Operations in the order they are plotted, with their derivative order
+OPERATIONS = ["original", "first_derivative", "second_derivative", "third_derivative", "integral"]
+DERIVATIVE_ORDERS = {
+    "original": 0,
+    "first_derivative": 1,
+    "second_derivative": 2,
+    "third_derivative": 3
+}
+LABELS = {
+    "original": "f(x)",
+    "first_derivative": "f'(x)",
+    "second_derivative": "f''(x)",
+    "third_derivative": "f'''(x)",
+    "integral": "∫f(x)dx"
+}
+# "auto" integrates symbolically and falls back to numeric integration
+INTEGRAL_MODES = ["auto", "symbolic", "numeric"]
+
+# Quantities of the surface mode for f(x, y), in display order
+SURFACE_OPERATIONS = ["original", "partial_x", "partial_y", "gradient_norm", "hessian_det"]
+SURFACE_LABELS = {
+    "original": "f(x, y)",
+    "partial_x": "∂f/∂x",
+    "partial_y": "∂f/∂y",
+    "gradient_norm": "|∇f|",
+    "hessian_det": "det H"
+}
@@ -0,0 +1,175 @@
+"""Roots, extrema and inflection points from already sampled curves.
+
+Candidates are the sign changes of f, f' and f'' between neighbouring
+samples; each bracket is then refined by a safeguarded Newton iteration
+(a bisection step whenever Newton would leave the bracket), run on all
+brackets of a curve at once. Nothing is solved symbolically.
+"""
+import numpy as np
+
+MAX_ITERATIONS = 60
+# Brackets are refined until narrower than this fraction of the sampled range
+X_TOLERANCE = 1e-12
+# A refined root is rejected (as a pole or jump) unless |f| is below this
+# fraction of the typical magnitude of the samples
+RESIDUAL_TOLERANCE = 1e-6
+# An extremum is also a root (touching zero without crossing) if |f| there is a
+# local minimum no larger than this, or than a double root would give at the
+# refined position (see touching_roots)
+TOUCH_TOLERANCE = 1e-10
+# Most points reported by analyze() over all kinds together
+MAX_POINTS = 200
+
+
+def sign_changes(y_vals):
+    """Return the indices i where y_vals changes sign between i and i + 1"""
+    with np.errstate(invalid='ignore'):
+        signs = np.sign(y_vals)
+        return np.flatnonzero(signs[:-1] * signs[1:] < 0)
+
+
+def isolated_zeros(y_vals):
+    """Return the indices of samples that are exactly zero while their neighbours are not
+
+    Runs of zeros (a curve that is zero over an interval) are not roots in
+    any useful sense and are left out.
+    """
+    zero = y_vals == 0
+    before = np.concatenate(([False], zero[:-1]))
+    after = np.concatenate((zero[1:], [False]))
+    return np.flatnonzero(zero & ~before & ~after)
+
+
+def identically_zero(y_vals):
+    """Whether every finite sample is zero, as for the derivative of a constant"""
+    finite = y_vals[np.isfinite(y_vals)]
+    return len(finite) > 0 and not np.any(finite)
+
+
+def typical_magnitude(y_vals):
+    finite = y_vals[np.isfinite(y_vals)]
+    return max(float(np.median(np.abs(finite))), 1.0) if len(finite) else 1.0
+
+
+def refine(func, derivative, a, b, fa, tolerance):
+    """Refine roots of func bracketed by [a, b], where fa = func(a) has the opposite sign of func(b)
+
+    derivative may be None, which leaves plain bisection.
+    """
+    x = (a + b) / 2
+    for _ in range(MAX_ITERATIONS):
+        fx = func(x)
+        # Keep the half whose ends still have opposite signs
+        same = np.sign(fx) == np.sign(fa)
+        a = np.where(same, x, a)
+        fa = np.where(same, fx, fa)
+        b = np.where(same, b, x)
+
+        x_new = (a + b) / 2
+        if derivative is not None:
+            with np.errstate(all='ignore'):
+                newton = x - fx / derivative(x)
+            x_new = np.where(np.isfinite(newton) & (newton > a) & (newton < b), newton, x_new)
+        converged = (fx == 0) | (np.abs(x_new - x) <= tolerance) | (b - a <= tolerance)
+        x = np.where(fx == 0, x, x_new)
+        if np.all(converged):
+            break
+    return x
+
+
+def find_roots(func, derivative, x_vals, y_vals):
+    """Return the refined roots of func among the samples y_vals = func(x_vals)
+
+    Isolated exact zeros on the grid are kept as they are. Sign changes
+    whose refined point does not bring func close to zero (poles, jumps)
+    are dropped. At most MAX_POINTS roots are returned.
+    """
+    if identically_zero(y_vals):
+        return x_vals[:0]
+    scale = typical_magnitude(y_vals)
+    exact = x_vals[isolated_zeros(y_vals)[:MAX_POINTS]]
+    segments = sign_changes(y_vals)[:MAX_POINTS]
+    if len(segments) == 0:
+        return exact
+    tolerance = X_TOLERANCE * max(x_vals[-1] - x_vals[0], 1.0)
+    roots = refine(func, derivative, x_vals[segments], x_vals[segments + 1], y_vals[segments], tolerance)
+    residual = np.abs(func(roots))
+    roots = roots[np.isfinite(residual) & (residual <= RESIDUAL_TOLERANCE * scale)]
+    return np.sort(np.concatenate((exact, roots)))[:MAX_POINTS]
+
+
+def crossing(func, points, step):
+    """Return (falling, rising) masks of points where func changes sign across point +- step"""
+    before, after = func(points - step), func(points + step)
+    return (before > 0) & (after < 0), (before < 0) & (after > 0)
+
+
+def touching_roots(f, extrema, x_vals, y_vals, step):
+    """Return the extrema where f touches zero without crossing it
+
+    Refinement places an extremum within X_TOLERANCE of the range of the
+    true one, so at a double root |f| there is at most about |f| at the
+    neighbouring samples times (that distance / sample spacing)^2. |f| must
+    also not grow smaller on either side.
+    """
+    lower = np.clip(np.searchsorted(x_vals, extrema, 'left') - 1, 0, len(x_vals) - 1)
+    upper = np.clip(np.searchsorted(x_vals, extrema, 'right'), 0, len(x_vals) - 1)
+    with np.errstate(invalid='ignore'):
+        local = np.fmax(np.abs(y_vals[lower]), np.abs(y_vals[upper]))
+        spacing = x_vals[upper] - x_vals[lower]
+        precision = X_TOLERANCE * max(x_vals[-1] - x_vals[0], 1.0)
+        limit = np.fmax(4 * local * (precision / spacing) ** 2, TOUCH_TOLERANCE)
+        height = np.abs(f(extrema))
+        touching = ((height <= limit) & (height <= np.abs(f(extrema - step)))
+                    & (height <= np.abs(f(extrema + step))))
+    return extrema[touching]
+
+
+def analyze(x_vals, samples, funcs):
+    """Find roots, extrema and inflection points of the original function
+
+    samples maps "original", "first_derivative" and "second_derivative" to
+    their values on x_vals, and funcs maps the same names plus
+    "third_derivative" to vectorized callables (or None when unavailable).
+    Returns {"roots", "minima", "maxima", "inflections"}, each a list of
+    (x, f(x)) pairs sorted by x. Zeros of f' where f' keeps its sign
+    (stationary inflection points, as of x^3 at 0) are not extrema, and
+    zeros of f'' where it keeps its sign (as of x^4 at 0) are not
+    inflections. A derivative that is zero at every sample gives no
+    extrema or inflections. Together the lists hold at most MAX_POINTS points, filled
+    in the order above.
+    """
+    f = funcs["original"]
+    features = {"roots": [], "minima": [], "maxima": [], "inflections": []}
+
+    def points(xs):
+        return list(zip(xs.tolist(), np.asarray(f(xs), dtype=float).tolist())) if len(xs) else []
+
+    roots = find_roots(f, funcs.get("first_derivative"), x_vals, samples["original"])
+    step = max(x_vals[-1] - x_vals[0], 1.0) * 1e-7
+
+    if "first_derivative" in samples and funcs.get("first_derivative") is not None:
+        slope = funcs["first_derivative"]
+        extrema = find_roots(slope, funcs.get("second_derivative"), x_vals, samples["first_derivative"])
+        if len(extrema):
+            # The slope rises through zero at a minimum and falls at a maximum
+            falling, rising = crossing(slope, extrema, step)
+            features["minima"] = points(extrema[rising])
+            features["maxima"] = points(extrema[falling])
+            touching = touching_roots(f, extrema[rising | falling], x_vals, samples["original"], step)
+            roots = np.unique(np.concatenate((roots, touching)))
+
+    if "second_derivative" in samples and funcs.get("second_derivative") is not None:
+        curvature = funcs["second_derivative"]
+        inflections = find_roots(curvature, funcs.get("third_derivative"), x_vals, samples["second_derivative"])
+        if len(inflections):
+            falling, rising = crossing(curvature, inflections, step)
+            inflections = inflections[falling | rising]
+        features["inflections"] = points(inflections)
+
+    features["roots"] = points(roots)
+    budget = MAX_POINTS
+    for kind in ("roots", "minima", "maxima", "inflections"):
+        features[kind] = features[kind][:budget]
+        budget -= len(features[kind])
+    return features
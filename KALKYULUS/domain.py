@@ -0,0 +1,144 @@
+"""Real domain of a function, so sampling skips the points where it is undefined.
+
+sympy's continuous_domain is asked once per expression; when it answers
+with a finite union of intervals, those are kept as floats and clipped to
+each plotted range without further symbolic work. Anything else (periodic
+gaps such as those of tan, unknown domains) means "sample everything" and
+leaves jumps and poles to adaptive sampling. Because sympy occasionally
+returns too small a domain (e.g. only one period of sqrt(sin(x))), the
+result is checked against probe samples before it is trusted.
+"""
+import numpy as np
+import sympy as sp
+from sympy.calculus.util import continuous_domain
+
+# Open ends of an interval are sampled this fraction of a grid step inside, so
+# the sample nearest a pole is no closer than on a grid straddling it
+OPEN_END_STEP = 0.5
+PROBE_POINTS = 256
+
+
+def real_domain(expr, symbol):
+    """Return the domain of expr as sorted (start, end, left_open, right_open) tuples, or None if unknown
+
+    Ends may be infinite. An empty list means expr is nowhere real.
+    Expressions with symbols besides symbol (parameters) are not analysed.
+    """
+    if expr.free_symbols - {symbol}:
+        return None
+    try:
+        domain = continuous_domain(expr, symbol, sp.S.Reals)
+    except Exception:
+        return None
+    if domain is sp.S.EmptySet:
+        return []
+    pieces = domain.args if isinstance(domain, sp.Union) else (domain,)
+    if not all(isinstance(piece, sp.Interval) for piece in pieces):
+        return None
+    intervals = [(float(piece.start), float(piece.end), bool(piece.left_open), bool(piece.right_open))
+                 for piece in pieces]
+    return sorted(intervals)
+
+
+def clip(intervals, x_min, x_max, step):
+    """Return the (start, end) pieces of intervals inside [x_min, x_max], with open ends moved inside
+
+    step is the spacing of the grid to be sampled; open ends move
+    OPEN_END_STEP of it inside, but never past a quarter of the piece.
+    """
+    pieces = []
+    for start, end, left_open, right_open in intervals:
+        a, b = max(start, x_min), min(end, x_max)
+        if a >= b:
+            continue
+        nudge = min(step * OPEN_END_STEP, (b - a) / 4)
+        if left_open and a == start:
+            a += nudge
+        if right_open and b == end:
+            b -= nudge
+        pieces.append((a, b))
+    return pieces
+
+
+def covers(pieces, x_min, x_max):
+    """Whether pieces is the whole of [x_min, x_max]"""
+    return len(pieces) == 1 and pieces[0] == (x_min, x_max)
+
+
+def inside(pieces, x_vals):
+    """Boolean mask of x_vals lying in one of pieces"""
+    mask = np.zeros(len(x_vals), dtype=bool)
+    for a, b in pieces:
+        mask |= (x_vals >= a) & (x_vals <= b)
+    return mask
+
+
+def consistent(func, pieces, x_min, x_max):
+    """Whether func(x) is undefined everywhere outside pieces on a probe grid
+
+    Probes within one probe spacing of a piece are skipped, so rounding
+    at the ends does not count against the domain.
+    """
+    probes = np.linspace(x_min, x_max, PROBE_POINTS)
+    margin = (x_max - x_min) / (PROBE_POINTS - 1)
+    outside = ~inside([(a - margin, b + margin) for a, b in pieces], probes)
+    if not np.any(outside):
+        return True
+    with np.errstate(all='ignore'):
+        values = np.broadcast_to(np.asarray(func(probes[outside])), probes[outside].shape)
+    return not np.any(np.isfinite(values) & np.isreal(values))
+
+
+def split_points(pieces, num_points):
+    """Share num_points between pieces in proportion to their width, at least 2 each
+
+    One point is kept back for each gap between pieces (see grid), so
+    shares and gaps add up to exactly num_points unless that leaves fewer
+    than 2 points for some piece.
+    """
+    widths = np.array([b - a for a, b in pieces])
+    total = max(num_points - (len(pieces) - 1), 2 * len(pieces))
+    exact = widths / widths.sum() * total
+    shares = np.maximum(np.floor(exact).astype(int), 2)
+    # Hand out the rounding difference by largest remainder, never below 2 points
+    while shares.sum() < total:
+        shares[np.argmax(exact - shares)] += 1
+    while shares.sum() > total:
+        shares[np.argmax(np.where(shares > 2, shares - exact, -np.inf))] -= 1
+    return shares.tolist()
+
+
+def grid(pieces, num_points):
+    """Evenly spaced points over each piece, with one gap point between pieces
+
+    Returns (x_vals, valid): valid is False at the gap points, which are
+    never evaluated and are left NaN so plotted lines break there.
+    """
+    parts = []
+    valid = []
+    for i, ((a, b), points) in enumerate(zip(pieces, split_points(pieces, num_points))):
+        if i:
+            parts.append([(pieces[i - 1][1] + a) / 2])
+            valid.append([False])
+        parts.append(np.linspace(a, b, points))
+        valid.append(np.ones(points, dtype=bool))
+    return np.concatenate(parts), np.concatenate(valid)
+
+
+def scatter(y_vals, valid):
+    """Spread values computed at the valid points over the whole grid, NaN elsewhere"""
+    full = np.full(len(valid), np.nan, dtype=y_vals.dtype)
+    full[valid] = y_vals
+    return full
+
+
+def describe(intervals):
+    """Format intervals like "[0, ∞)" or "(-∞, -1] ∪ [1, ∞)"; "∅" if empty"""
+    if not intervals:
+        return "∅"
+
+    def number(value):
+        return "∞" if value == np.inf else "-∞" if value == -np.inf else f"{value:.4g}"
+
+    return " ∪ ".join(f"{'(' if left_open else '['}{number(start)}, {number(end)}{')' if right_open else ']'}"
+                      for start, end, left_open, right_open in intervals)
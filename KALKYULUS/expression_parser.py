@@ -0,0 +1,323 @@
+"""Parser for the function strings typed into the grapher.
+
+Input is tokenized and parsed in one left-to-right pass into a small tree of
+tuples, which is then turned into a sympy expression. Besides Python syntax
+it accepts ^ for powers, ln, nested |...| absolute values, π and ∞, implicit
+multiplication ("2x", "x sin x", "(x+1)(x-1)"), function application
+without parentheses ("sin x") and function powers ("sin^2(x)"). Errors carry
+the position in the input they refer to.
+
+Building the tree needs no sympy, so validate() is cheap enough to call on
+every keystroke; both steps are cached on the input string.
+"""
+from functools import lru_cache
+
+# Function names, with the sympy function each one stands for
+FUNCTIONS = {
+    "sin": "sin", "cos": "cos", "tan": "tan", "cot": "cot", "sec": "sec", "csc": "csc",
+    "asin": "asin", "acos": "acos", "atan": "atan", "acot": "acot", "asec": "asec", "acsc": "acsc",
+    "arcsin": "asin", "arccos": "acos", "arctan": "atan",
+    "sinh": "sinh", "cosh": "cosh", "tanh": "tanh", "coth": "coth", "sech": "sech", "csch": "csch",
+    "asinh": "asinh", "acosh": "acosh", "atanh": "atanh",
+    "exp": "exp", "log": "log", "ln": "log", "sqrt": "sqrt", "cbrt": "cbrt", "root": "root",
+    "abs": "Abs", "Abs": "Abs", "sign": "sign", "floor": "floor", "ceil": "ceiling", "ceiling": "ceiling",
+    "gamma": "gamma", "erf": "erf", "factorial": "factorial", "Heaviside": "Heaviside",
+    "max": "Max", "Max": "Max", "min": "Min", "Min": "Min", "re": "re", "im": "im"
+}
+# Named constants, with the sympy object each one stands for
+CONSTANTS = {"e": "E", "E": "E", "pi": "pi", "π": "pi", "oo": "oo", "inf": "oo", "∞": "oo", "I": "I"}
+NAMES = {**FUNCTIONS, **CONSTANTS}
+LONGEST_NAME = max(len(name) for name in NAMES)
+# Single characters that are names on their own even though they are not letters
+SYMBOL_CHARACTERS = {"∞"}
+OPERATORS = {"+", "-", "*", "/", "^", "(", ")", ",", "|", "!"}
+PARSE_CACHE_SIZE = 512
+
+
+class ParseError(ValueError):
+    """A function string that cannot be parsed; position is the 0-based offset of the problem"""
+
+    def __init__(self, message, position):
+        super().__init__(f"{message} at position {position + 1}")
+        self.message = message
+        self.position = position
+
+
+def split_name(word, start):
+    """Split a run of letters into known names, longest first, and single-letter symbols
+
+    "xsin" becomes x and sin, "pix" becomes pi and x, and unknown words
+    such as "ab" become a and b.
+    """
+    tokens = []
+    i = 0
+    while i < len(word):
+        for length in range(min(LONGEST_NAME, len(word) - i), 0, -1):
+            if word[i:i + length] in NAMES:
+                break
+        else:
+            length = 1
+        tokens.append(("name", word[i:i + length], start + i))
+        i += length
+    return tokens
+
+
+def tokenize(text):
+    """Return a list of (kind, value, position) tokens, ending with an "end" token
+
+    kind is "number", "name" or "op"; ** is returned as ^.
+    """
+    tokens = []
+    i = 0
+    n = len(text)
+    while i < n:
+        char = text[i]
+        if char.isspace():
+            i += 1
+        elif char.isdigit() or (char == "." and i + 1 < n and text[i + 1].isdigit()):
+            start = i
+            while i < n and text[i].isdigit():
+                i += 1
+            if i < n and text[i] == ".":
+                i += 1
+                while i < n and text[i].isdigit():
+                    i += 1
+            # Scientific notation only if digits follow; otherwise "2e" is 2 times e
+            if i < n and text[i] in "eE":
+                j = i + 1
+                if j < n and text[j] in "+-":
+                    j += 1
+                if j < n and text[j].isdigit():
+                    i = j
+                    while i < n and text[i].isdigit():
+                        i += 1
+            tokens.append(("number", text[start:i], start))
+        elif char.isalpha():
+            start = i
+            while i < n and text[i].isalpha():
+                i += 1
+            tokens.extend(split_name(text[start:i], start))
+        elif char in SYMBOL_CHARACTERS:
+            tokens.append(("name", char, i))
+            i += 1
+        elif text.startswith("**", i):
+            tokens.append(("op", "^", i))
+            i += 2
+        elif char in OPERATORS:
+            tokens.append(("op", char, i))
+            i += 1
+        else:
+            raise ParseError(f"Unexpected character '{char}'", i)
+    tokens.append(("end", "", n))
+    return tokens
+
+
+class Parser:
+    """Recursive descent parser from tokens to a tuple tree
+
+    Precedence from low to high: + and -, * and / and implicit
+    multiplication, unary signs, ^ (right associative), postfix !.
+    Inside |...| a bar after a complete operand closes the innermost
+    absolute value; elsewhere it opens a new one.
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.index = 0
+        self.bars = 0
+
+    @property
+    def token(self):
+        return self.tokens[self.index]
+
+    def advance(self):
+        token = self.tokens[self.index]
+        self.index += 1
+        return token
+
+    def at(self, value):
+        kind, token_value, _ = self.token
+        return kind == "op" and token_value == value
+
+    def expect(self, value):
+        if not self.at(value):
+            self.fail(f"Expected '{value}'")
+        return self.advance()
+
+    def fail(self, message=None):
+        kind, value, position = self.token
+        if message is None:
+            message = "Unexpected end of input" if kind == "end" else f"Unexpected '{value}'"
+        elif kind == "end":
+            message += ", found end of input"
+        else:
+            message += f", found '{value}'"
+        raise ParseError(message, position)
+
+    def parse(self):
+        if self.token[0] == "end":
+            raise ParseError("Empty expression", 0)
+        tree = self.sum()
+        if self.token[0] != "end":
+            self.fail()
+        return tree
+
+    def sum(self):
+        tree = self.term()
+        while self.at("+") or self.at("-"):
+            op = self.advance()[1]
+            tree = ("add" if op == "+" else "sub", tree, self.term())
+        return tree
+
+    def term(self):
+        tree = self.unary()
+        while True:
+            if self.at("*") or self.at("/"):
+                op = self.advance()[1]
+                tree = ("mul" if op == "*" else "div", tree, self.unary())
+            elif self.starts_operand():
+                tree = ("mul", tree, self.power())
+            else:
+                return tree
+
+    def implicit_product(self):
+        # Argument of a function applied without parentheses: "sin 2x" is sin(2x)
+        tree = self.power()
+        while self.starts_operand():
+            tree = ("mul", tree, self.power())
+        return tree
+
+    def starts_operand(self):
+        kind, value, _ = self.token
+        if kind in ("number", "name"):
+            return True
+        # A bar after an operand closes an open absolute value, otherwise it starts one
+        return kind == "op" and (value == "(" or (value == "|" and self.bars == 0))
+
+    def unary(self):
+        if self.at("-"):
+            self.advance()
+            return ("neg", self.unary())
+        if self.at("+"):
+            self.advance()
+            return self.unary()
+        return self.power()
+
+    def power(self):
+        base = self.postfix()
+        if self.at("^"):
+            self.advance()
+            return ("pow", base, self.unary())
+        return base
+
+    def postfix(self):
+        tree = self.primary()
+        while self.at("!"):
+            self.advance()
+            tree = ("call", "factorial", (tree,))
+        return tree
+
+    def primary(self):
+        kind, value, position = self.token
+        if kind == "number":
+            self.advance()
+            return ("number", value)
+        if kind == "name":
+            self.advance()
+            if value in FUNCTIONS:
+                return self.function(value)
+            if value in CONSTANTS:
+                return ("constant", CONSTANTS[value])
+            return ("symbol", value)
+        if self.at("("):
+            self.advance()
+            tree = self.sum()
+            self.expect(")")
+            return tree
+        if self.at("|"):
+            self.advance()
+            self.bars += 1
+            tree = self.sum()
+            if not self.at("|"):
+                self.fail("Expected '|'")
+            self.advance()
+            self.bars -= 1
+            return ("call", "Abs", (tree,))
+        self.fail("Expected a number, name or '('")
+
+    def function(self, name):
+        # "sin^2(x)" is sin(x)^2; name is as typed and reported in errors
+        exponent = None
+        if self.at("^"):
+            self.advance()
+            exponent = self.unary()
+
+        if self.at("("):
+            self.advance()
+            args = [self.sum()]
+            while self.at(","):
+                self.advance()
+                args.append(self.sum())
+            self.expect(")")
+        elif self.starts_operand() or self.at("-"):
+            args = [self.unary() if self.at("-") else self.implicit_product()]
+        else:
+            self.fail(f"Expected an argument for {name}")
+
+        tree = ("call", FUNCTIONS[name], tuple(args))
+        return tree if exponent is None else ("pow", tree, exponent)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_tree(text):
+    """Parse text into a tuple tree, raising ParseError"""
+    return Parser(text).parse()
+
+
+def validate(text):
+    """Return the ParseError for text, or None if it parses"""
+    try:
+        parse_tree(text)
+    except ParseError as e:
+        return e
+    return None
+
+
+def build(tree):
+    """Turn a tuple tree into a sympy expression"""
+    import sympy as sp
+
+    kind = tree[0]
+    if kind == "number":
+        text = tree[1]
+        return sp.Integer(text) if text.isdigit() else sp.Float(text)
+    if kind == "constant":
+        return getattr(sp, tree[1])
+    if kind == "symbol":
+        return sp.Symbol(tree[1])
+    if kind == "call":
+        return getattr(sp, tree[1])(*(build(arg) for arg in tree[2]))
+    if kind == "neg":
+        return -build(tree[1])
+
+    left, right = build(tree[1]), build(tree[2])
+    if kind == "add":
+        return left + right
+    if kind == "sub":
+        return left - right
+    if kind == "mul":
+        return left * right
+    if kind == "div":
+        return left / right
+    return left ** right
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse(text):
+    """Parse text into a sympy expression, raising ParseError"""
+    return build(parse_tree(text))
+
+
+def clear_cache():
+    parse_tree.cache_clear()
+    parse.cache_clear()
@@ -1,16 +1,59 @@
+import time
+# Taken before the imports below so the startup report covers them
+startup_time = time.perf_counter()
+
+import sys
 import tkinter as tk
-from tkinter import ttk, StringVar, messagebox
+from tkinter import ttk, StringVar, messagebox, filedialog
 import ttkbootstrap as ttb
 from ttkbootstrap.constants import *
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
-import sympy as sp
-import numpy as np
-from sympy import symbols, diff, integrate, sympify, E, pi, oo, exp, sin, cos, tan, log, sqrt
-from sympy.parsing.sympy_parser import parse_expr, standard_transformations, implicit_multiplication_application
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import calculus_operations
+import expression_parser
+import profiling
+import symbolic_store
+
+
+# sympy (through calculus_engine) and matplotlib take most of the startup time,
+# so they are imported on the worker pool once the window is on screen
+
+def load_plotting():
+    """Import the matplotlib classes used by the plot"""
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+    return Figure, FigureCanvasTkAgg, NavigationToolbar2Tk
+
+def calculate(*args, **kwargs):
+    """Run calculus_engine.calculate, importing the engine on first use
+    
+    Symbolic results are also kept on disk, so functions plotted in earlier
+    sessions skip differentiation and integration.
+    """
+    import calculus_engine
+    calculus_engine.symbolic_cache.open_store()
+    return calculus_engine.calculate(*args, **kwargs)
+
+def export_large(*args, **kwargs):
+    """Run large_export.export, which needs the engine, importing it on first use"""
+    import large_export
+    return large_export.export(*args, **kwargs)
+
+def calculate_surface(*args, **kwargs):
+    """Run surface_engine.calculate_surface, importing it on first use"""
+    import surface_engine
+    return surface_engine.calculate_surface(*args, **kwargs)
+
+def warm_up(func_str, x_min, x_max, operations, options):
+    """Import the engine and compute the initial function so the first plot hits the cache"""
+    try:
+        calculate(func_str, x_min, x_max, operations, **options)
+    except Exception:
+        # The user sees any error when they plot it themselves
+        pass
 
 class CalculusFunctionGrapher:
-    def __init__(self, root):
+    def __init__(self, root, report_startup=False):
         self.root = root
         self.root.title("Calculus Function Grapher")
         self.root.geometry("1200x700")
@@ -75,15 +118,79 @@ class CalculusFunctionGrapher:
             }
         }
         
-        self.function_history = []
+        # History is kept on disk with the symbolic results (only sqlite3 is needed to read it)
+        self.store = symbolic_store.SymbolicStore()
+        self.function_history = self.store.history()
         self.current_theme_colors = self.colors["glass_dark"]  # Default to glass dark
         
+        # One persistent line per operation, updated in place (created in setup_plot)
+        self.lines = {}
+        self.last_result = None
+        self.plotted_function = None
+        
+        # Overlaid functions: function string -> {operation: line}, each sampled on its own
+        self.overlays = {}
+        self.overlay_styles = ['--', ':', '-.']
+        self.sampled_xlim = None
+        self.autoscaled_ylim = None  # y limits last set by autoscaling; any other value means the user zoomed
+        self.resample_job = None
+        self.resample_delay = 150  # milliseconds of pan/zoom inactivity before resampling
+        
+        # Live mode: replot as the function or range is edited, first coarsely, then in full once typing pauses
+        self.live_mode = tk.BooleanVar(value=False)
+        self.preview_job = None
+        self.refine_job = None
+        self.preview_delay = 150  # milliseconds after the last edit
+        self.refine_delay = 600
+        self.preview_points = 200
+        
+        # Free parameters of the plotted function (e.g. a and b in a*sin(b*x)), one slider each.
+        # Values are kept by name, so a parameter keeps its value when the function changes.
+        self.parameter_vars = {}
+        self.parameter_labels = {}
+        self.parameter_names = ()
+        self.parameter_job = None
+        self.parameter_delay = 20  # milliseconds; coalesces slider motion into one update per frame
+        self.parameter_range = (-10, 10)
+        
+        # Roots, extrema and inflection points of f, found by the engine from the samples
+        self.show_features = tk.BooleanVar(value=True)
+        
+        # Complex mode plots real parts as usual and imaginary parts as dashed lines
+        self.complex_mode = tk.BooleanVar(value=False)
+        self.imag_lines = {}
+        # Share of non-real samples of f above which the info panel suggests complex mode
+        self.non_real_hint = 0.05
+        self.feature_markers = {}
+        self.feature_annotations = []
+        self.max_feature_annotations = 12  # beyond this the points are only marked, not labelled
+        
+        # Background computation; results are picked up on the Tk thread by polling
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.jobs = {}
+        self.poll_interval = 50  # milliseconds
+        self.integrate_timeout = 5.0  # seconds before falling back to numeric integration
+        self.integral_mode = StringVar(value="auto")
+        self.integral_anchor = 0.0  # numeric integrals are zero here, so panning keeps them in place
+        
+        # The plot is created once matplotlib has been imported in the background
+        self.fig = None
+        self.report_startup = report_startup  # print startup timings and quit once warmed up
+        self.time_to_first_window = None
+        
+        # Stage timings of recent calculations, shown on request and exported as JSON
+        self.show_timings = tk.BooleanVar(value=False)
+        self.profiles = deque(maxlen=200)
+        
+        # Export of the current function on a grid far finer than the plot, evaluated in chunks
+        self.export_points = tk.IntVar(value=10_000_000)
+        
         # Setup UI components
         self.setup_left_panel()
         self.setup_right_panel()
         
-        # Initialize the plot
-        self.setup_plot()
+        # Load the plot and the engine once the window is shown
+        self.root.bind("<Map>", self.on_first_map, add="+")
         
         # Add keyboard bindings
         self.root.bind("<Return>", lambda event: self.calculate_and_plot())
@@ -136,9 +243,36 @@ class CalculusFunctionGrapher:
         # Update plot styles for glassmorphic effect
         self.update_plot_styles()
         
+    def on_first_map(self, event):
+        if event.widget is not self.root or self.time_to_first_window is not None:
+            return
+        self.time_to_first_window = time.perf_counter() - startup_time
+        if self.report_startup:
+            print(f"window shown: {self.time_to_first_window:.3f} s")
+        self.submit("load_plotting", self.on_plotting_loaded, load_plotting)
+        operations = [key for key, var in self.selected_operations.items() if var.get()]
+        self.submit("warm_up", self.on_warmed_up, warm_up, self.function_str.get(), self.x_min.get(),
+                    self.x_max.get(), operations, self.engine_options())
+    
+    def on_plotting_loaded(self, future):
+        try:
+            future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not load matplotlib: {str(e)}")
+            return
+        self.setup_plot()
+        if self.report_startup:
+            print(f"plot ready: {time.perf_counter() - startup_time:.3f} s")
+    
+    def on_warmed_up(self, future):
+        if self.report_startup:
+            print(f"engine warmed up: {time.perf_counter() - startup_time:.3f} s")
+            self.root.destroy()
+    
     def setup_plot(self):
         # Initialize the plot
-        self.fig = plt.figure(figsize=(6, 6), facecolor=self.current_theme_colors["bg"])
+        Figure, FigureCanvasTkAgg, NavigationToolbar2Tk = load_plotting()
+        self.fig = Figure(figsize=(6, 6), facecolor=self.current_theme_colors["bg"])
         self.ax = self.fig.add_subplot(111)
         
         # FIX: Handle plot background color based on type
@@ -167,10 +301,28 @@ class CalculusFunctionGrapher:
                 # Don't set activebackground as it causes the error
         
         # Add an initial message to the plot
-        self.ax.text(0.5, 0.5, "Results will appear here...", 
+        self.placeholder_text = self.ax.text(0.5, 0.5, "Results will appear here...", 
                     ha='center', va='center', color=self.current_theme_colors["text"], fontsize=12,
                     transform=self.ax.transAxes)
         
+        # Create the lines once; later plots only change their data, colors and visibility
+        for index, operation in enumerate(calculus_operations.OPERATIONS):
+            self.lines[operation], = self.ax.plot([], [], label=calculus_operations.LABELS[operation],
+                                                  color=self.current_theme_colors["functions"][index],
+                                                  linewidth=2, alpha=0.9, visible=False)  # slightly transparent for glass effect
+            self.imag_lines[operation], = self.ax.plot([], [], label=f"Im {calculus_operations.LABELS[operation]}",
+                                                       color=self.current_theme_colors["functions"][index],
+                                                       linewidth=1.5, linestyle="--", alpha=0.9, visible=False)
+        
+        # Markers for roots, extrema and inflection points, left out of the legend
+        feature_styles = {"roots": "o", "minima": "v", "maxima": "^", "inflections": "D"}
+        for kind, marker in feature_styles.items():
+            self.feature_markers[kind], = self.ax.plot([], [], linestyle="", marker=marker, markersize=6,
+                                                       color=self.current_theme_colors["text"], visible=False)
+        
+        # Resample when the toolbar pans or zooms
+        self.ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+        
         # Set up grid and styles
         self.update_plot_styles()
         
@@ -178,6 +330,10 @@ class CalculusFunctionGrapher:
         self.canvas.draw()
         
     def update_plot_styles(self):
+        if self.fig is None:
+            # Not created yet; setup_plot applies the styles
+            return
+        
         # Apply glassmorphic effect to plot if enabled
         if self.glass_mode.get():
             if self.dark_mode.get():
@@ -238,7 +394,7 @@ class CalculusFunctionGrapher:
         
         # Function input
         function_frame = ttb.Frame(left_frame, bootstyle="dark")
-        function_frame.pack(fill=tk.X, pady=(0, 20))
+        function_frame.pack(fill=tk.X, pady=(0, 5))
         
         function_label = ttb.Label(function_frame, text="f(x) =")
         function_label.pack(side=tk.LEFT, padx=(0, 10))
@@ -249,6 +405,11 @@ class CalculusFunctionGrapher:
         function_entry.bind("<Return>", lambda event: self.calculate_and_plot())
         function_entry.focus_set()
         
+        # Live syntax check of the function, pointing at the first error
+        self.validation_label = ttb.Label(left_frame, text="", font=("Arial", 9), bootstyle="danger")
+        self.validation_label.pack(fill=tk.X, pady=(0, 10))
+        self.function_str.trace_add("write", lambda *args: self.validate_function())
+        
         # Calculator buttons
         button_frame = ttb.Frame(left_frame)
         button_frame.pack(fill=tk.X, pady=(0, 20))
@@ -334,6 +495,7 @@ class CalculusFunctionGrapher:
             cb_frame.pack(fill=tk.X, padx=10, pady=2)
             
             cb = ttb.Checkbutton(cb_frame, text=text, variable=self.selected_operations[key], 
+                                command=lambda k=key: self.on_operation_toggled(k),
                                 bootstyle="round-toggle")
             cb.pack(side=tk.LEFT, pady=2)
             
@@ -341,20 +503,72 @@ class CalculusFunctionGrapher:
             color_indicator = ttb.Label(cb_frame, text="■", foreground=color, font=("Arial", 12, "bold"))
             color_indicator.pack(side=tk.RIGHT)
         
+        # How the integral is computed: symbolic, numeric, or symbolic with numeric fallback
+        integral_mode_frame = ttb.Frame(operations_frame)
+        integral_mode_frame.pack(fill=tk.X, padx=10, pady=(2, 5))
+        
+        integral_mode_label = ttb.Label(integral_mode_frame, text="Integral mode:")
+        integral_mode_label.pack(side=tk.LEFT, padx=(0, 5))
+        
+        integral_mode_combobox = ttb.Combobox(integral_mode_frame, textvariable=self.integral_mode,
+                                             values=calculus_operations.INTEGRAL_MODES, state="readonly",
+                                             width=10, bootstyle="dark")
+        integral_mode_combobox.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        features_cb = ttb.Checkbutton(operations_frame, text="Roots & Extrema", variable=self.show_features,
+                                    command=self.on_features_toggled, bootstyle="round-toggle")
+        features_cb.pack(anchor=tk.W, padx=10, pady=(2, 5))
+        
+        complex_cb = ttb.Checkbutton(operations_frame, text="Complex (Re/Im)", variable=self.complex_mode,
+                                   command=self.on_complex_toggled, bootstyle="round-toggle")
+        complex_cb.pack(anchor=tk.W, padx=10, pady=(2, 5))
+        
         # Function history with glassmorphic effect
         history_frame = ttb.Labelframe(left_frame, text="Function History", bootstyle="light")
         history_frame.pack(fill=tk.X, pady=(0, 20))
         
         self.history_combobox = ttb.Combobox(history_frame, bootstyle="dark")
         self.history_combobox.pack(fill=tk.X, padx=10, pady=10)
+        self.history_combobox['values'] = self.function_history
         self.history_combobox.set(self.function_str.get())
         self.history_combobox.bind("<<ComboboxSelected>>", self.on_history_selected)
         
+        # Sliders for the free parameters of the plotted function, filled in by update_parameter_sliders
+        self.parameter_frame = ttb.Labelframe(left_frame, text="Parameters", bootstyle="light")
+        self.parameter_frame.pack(fill=tk.X, pady=(0, 20))
+        self.update_parameter_sliders({})
+        
+        # Overlays: extra functions drawn on the same axes
+        overlay_frame = ttb.Labelframe(left_frame, text="Overlays", bootstyle="light")
+        overlay_frame.pack(fill=tk.X, pady=(0, 20))
+        
+        self.overlay_combobox = ttb.Combobox(overlay_frame, state="readonly", bootstyle="dark")
+        self.overlay_combobox.pack(fill=tk.X, padx=10, pady=(10, 5))
+        
+        overlay_buttons = ttb.Frame(overlay_frame)
+        overlay_buttons.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
+        add_overlay_btn = ttb.Button(overlay_buttons, text="Overlay f(x)", command=self.add_overlay, bootstyle="dark")
+        add_overlay_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 2))
+        
+        remove_overlay_btn = ttb.Button(overlay_buttons, text="Remove", command=self.remove_overlay, bootstyle="dark")
+        remove_overlay_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(2, 0))
+        
         # Calculate button with glassmorphic effect
         calculate_btn = ttb.Button(left_frame, text="Calculate",
                                  command=self.calculate_and_plot, bootstyle="success")
         calculate_btn.pack(fill=tk.X, pady=5)
         
+        # Live mode toggle: replot while typing
+        live_mode_btn = ttb.Checkbutton(left_frame, text="Live Plot",
+                                      variable=self.live_mode,
+                                      command=self.on_input_changed,
+                                      bootstyle="round-toggle")
+        live_mode_btn.pack(fill=tk.X, pady=5)
+        
+        for var in (self.function_str, self.x_min, self.x_max):
+            var.trace_add("write", lambda *args: self.on_input_changed())
+        
         # Style toggle buttons
         style_frame = ttb.Frame(left_frame)
         style_frame.pack(fill=tk.X, pady=5)
@@ -372,6 +586,36 @@ class CalculusFunctionGrapher:
                                        command=self.update_theme, 
                                        bootstyle="round-toggle")
         glass_mode_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        
+        # Per-stage timings of each calculation
+        timings_frame = ttb.Frame(left_frame)
+        timings_frame.pack(fill=tk.X, pady=5)
+        
+        timings_btn = ttb.Checkbutton(timings_frame, text="Show Timings",
+                                    variable=self.show_timings,
+                                    command=self.toggle_timings,
+                                    bootstyle="round-toggle")
+        timings_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(0, 5))
+        
+        export_timings_btn = ttb.Button(timings_frame, text="Export Timings", command=self.export_timings,
+                                      bootstyle="dark")
+        export_timings_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(5, 0))
+        
+        # Large-grid export to .npy or a high-resolution image
+        export_frame = ttb.Frame(left_frame)
+        export_frame.pack(fill=tk.X, pady=5)
+        
+        ttb.Label(export_frame, text="Points:").pack(side=tk.LEFT, padx=(0, 5))
+        export_points_entry = ttb.Entry(export_frame, textvariable=self.export_points, width=12)
+        export_points_entry.pack(side=tk.LEFT, padx=(0, 5))
+        
+        export_btn = ttb.Button(export_frame, text="Export...", command=self.export_large, bootstyle="dark")
+        export_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # Functions of x and y open in their own window
+        surface_btn = ttb.Button(left_frame, text="Surface f(x, y)...", command=self.open_surface_window,
+                               bootstyle="dark")
+        surface_btn.pack(fill=tk.X, pady=5)
     
     def setup_right_panel(self):
         # Function information panel at the bottom
@@ -381,6 +625,22 @@ class CalculusFunctionGrapher:
         # Labels for derivative and integral information with glassmorphic effect
         self.func_info_label = ttb.Label(self.info_frame, text="", font=("Arial", 9), anchor=tk.W, justify=tk.LEFT)
         self.func_info_label.pack(side=tk.LEFT, padx=5)
+        
+        # Stage timings of the last calculation, packed while "Show Timings" is on
+        self.timing_label = ttb.Label(self.info_frame, text="", font=("Courier", 8), anchor=tk.W, justify=tk.LEFT)
+        
+        # Busy indicator while a computation runs in the background
+        self.progress = ttb.Progressbar(self.info_frame, mode="indeterminate", bootstyle="info", length=120)
+        self.progress.pack(side=tk.RIGHT, padx=5)
+    
+    def validate_function(self):
+        """Check the function as it is typed; parse results are cached, so this is cheap"""
+        func_str = self.function_str.get()
+        error = expression_parser.validate(func_str) if func_str.strip() else None
+        if error is None:
+            self.validation_label.config(text="")
+        else:
+            self.validation_label.config(text=f"{error.message} (column {error.position + 1})")
     
     def on_calculator_button(self, button_text):
         current_text = self.function_str.get()
@@ -466,15 +726,217 @@ class CalculusFunctionGrapher:
         # Apply glassmorphic style if enabled
         self.apply_glassmorphic_style()
         
-        # If there's a plot already, recalculate to update colors
-        if hasattr(self, 'ax') and len(self.ax.lines) > 0:
-            self.calculate_and_plot()
+        # Recolor the existing lines; no recalculation needed
+        if self.fig is not None:
+            self.update_line_styles()
+            self.canvas.draw_idle()
+    
+    def update_line_styles(self):
+        """Apply the current theme colors to the persistent lines and legend"""
+        for index, operation in enumerate(calculus_operations.OPERATIONS):
+            self.lines[operation].set_color(self.current_theme_colors["functions"][index])
+            self.imag_lines[operation].set_color(self.current_theme_colors["functions"][index])
+        for lines in self.overlays.values():
+            for operation, line in lines.items():
+                line.set_color(self.current_theme_colors["functions"][calculus_operations.OPERATIONS.index(operation)])
+        self.placeholder_text.set_color(self.current_theme_colors["text"])
+        for marker in self.feature_markers.values():
+            marker.set_color(self.current_theme_colors["text"])
+        for annotation in self.feature_annotations:
+            annotation.set_color(self.current_theme_colors["text"])
+        self.update_legend()
+    
+    def update_legend(self):
+        visible = [line for line in self.lines.values() if line.get_visible()]
+        visible += [line for line in self.imag_lines.values() if line.get_visible()]
+        for lines in self.overlays.values():
+            visible += [line for line in lines.values() if line.get_visible()]
+        if visible:
+            self.ax.legend(handles=visible, loc="upper right", fontsize=10, frameon=False)
+        elif self.ax.get_legend() is not None:
+            self.ax.get_legend().remove()
+    
+    def visible_operations(self):
+        return [operation for operation, line in self.lines.items() if line.get_visible()]
+    
+    def on_operation_toggled(self, operation):
+        """Show or hide one curve without replotting the others"""
+        if self.last_result is None:
+            return
+        if not self.selected_operations[operation].get():
+            self.lines[operation].set_visible(False)
+            self.imag_lines[operation].set_visible(False)
+        elif operation in self.last_result.curves:
+            # Already sampled for the current view
+            curve = self.last_result.curves[operation]
+            self.lines[operation].set_visible(curve.error is None)
+            self.imag_lines[operation].set_visible(curve.error is None and curve.imag_vals is not None)
+        else:
+            # Sample the newly selected curve over the current view, keeping the axes as they are
+            view_min, view_max = self.sampled_xlim
+            operations = self.visible_operations() + [operation]
+            self.submit("calculate", lambda future: self.plot_result(future, self.plotted_function, view_min, view_max,
+                                                                     autoscale=False),
+                        calculate, self.plotted_function, view_min, view_max, operations,
+                        **self.engine_options())
+            return
+        self.rescale_to_visible()
+        self.update_features(self.last_result)
+        self.update_legend()
+        self.update_info()
+        self.canvas.draw_idle()
+    
+    def rescale_to_visible(self):
+        """Fit the y axis to the visible curves, unless the user has zoomed since the last autoscale
+        
+        The limits come from ranges the engine computed with the samples, so
+        this is cheap and showing the same curves again gives the same axes.
+        """
+        if self.autoscaled_ylim is None or self.ax.get_ylim() != self.autoscaled_ylim:
+            return
+        limits = self.last_result.limits(self.visible_operations())
+        if limits is not None:
+            self.ax.set_ylim(*limits)
+            self.autoscaled_ylim = self.ax.get_ylim()
+
+    def on_complex_toggled(self):
+        """Resample the current view with or without the imaginary parts"""
+        if self.last_result is not None:
+            self.resample(*self.sampled_xlim)
+    
+    def set_curve_data(self, operation, x_vals, curve):
+        """Show curve on the line of operation, plus its imaginary part if it has one"""
+        self.lines[operation].set_data(x_vals, curve.plot_values)
+        imag_line = self.imag_lines[operation]
+        if curve.imag_vals is None:
+            imag_line.set_visible(False)
+            return
+        imag_line.set_data(x_vals, curve.plot_imag_values)
+        imag_line.set_visible(self.lines[operation].get_visible())
+    
+    def on_features_toggled(self):
+        if self.last_result is None:
+            return
+        if self.show_features.get() and self.last_result.features is None:
+            # Computed without the analysis; resample the current view with it
+            self.resample(*self.sampled_xlim)
+            return
+        self.update_features(self.last_result)
+        self.update_info()
+        self.canvas.draw_idle()
+    
+    def update_features(self, result):
+        """Mark the roots, extrema and inflection points of f, labelling them when there are few"""
+        for annotation in self.feature_annotations:
+            annotation.remove()
+        self.feature_annotations = []
+        
+        shown = self.show_features.get() and self.lines["original"].get_visible() and result.features is not None
+        features = result.features if shown else {}
+        for kind, marker in self.feature_markers.items():
+            points = features.get(kind, [])
+            marker.set_data([px for px, _ in points], [py for _, py in points])
+            marker.set_visible(bool(points))
+        
+        # A point can be several kinds at once (a root that is also an inflection point); label it once
+        labelled = sorted({(px, py) for points in features.values() for px, py in points})
+        if len(labelled) <= self.max_feature_annotations:
+            for px, py in labelled:
+                self.feature_annotations.append(self.ax.annotate(
+                    f"({px:.3g}, {py:.3g})", (px, py), textcoords="offset points", xytext=(5, 5),
+                    fontsize=8, color=self.current_theme_colors["text"]))
+    
+    def update_info(self):
+        """Show the symbolic result of every visible curve in the info panel"""
+        from sympy import pretty
+        from domain import describe
+        
+        func_info = []
+        for operation in calculus_operations.OPERATIONS:
+            curve = self.last_result.curves.get(operation)
+            if curve is None or not self.selected_operations[operation].get():
+                continue
+            if curve.error is not None:
+                func_info.append(f"{curve.label} = {pretty(curve.expr)} (Error plotting: {str(curve.error)})")
+            elif curve.numeric:
+                func_info.append(f"{curve.label} = {pretty(curve.expr)} (numeric, error ≈ {curve.error_estimate:.2g})")
+            else:
+                func_info.append(f"{curve.label} = {pretty(curve.expr)}")
+        
+        # Say why parts of f are missing instead of leaving silent gaps
+        result = self.last_result
+        if result.domain is not None and result.domain != [(-float("inf"), float("inf"), True, True)]:
+            func_info.append(f"Domain of f: {describe(result.domain)}")
+        original = result.curves.get("original")
+        if not result.complex_mode and original is not None and original.error is None:
+            non_real = 1 - float(original.mask.mean())
+            if non_real > self.non_real_hint:
+                func_info.append(f"f(x) is not real on {non_real:.0%} of the range; turn on Complex to see it")
+        
+        features = self.last_result.features
+        if features is not None and self.show_features.get() and self.selected_operations["original"].get():
+            names = {"roots": "Roots", "minima": "Minima", "maxima": "Maxima", "inflections": "Inflection points"}
+            for kind, name in names.items():
+                points = features[kind]
+                if points:
+                    listed = ", ".join(f"{px:.4g}" for px, _ in points[:8])
+                    func_info.append(f"{name}: x ≈ {listed}" + (f" (+{len(points) - 8} more)" if len(points) > 8 else ""))
+        self.func_info_label.config(text="\n".join(func_info))
+    
+    def submit(self, kind, callback, func, *args, **kwargs):
+        """Run func on the worker pool and hand its future to callback on the Tk thread
+        
+        A newer job of the same kind supersedes this one: it is cancelled if it
+        has not started yet, and its result is ignored otherwise.
+        """
+        previous = self.jobs.get(kind)
+        if previous is not None:
+            previous.cancel()
+        future = self.executor.submit(func, *args, **kwargs)
+        self.jobs[kind] = future
+        self.set_busy(True)
+        self.root.after(self.poll_interval, self.poll_job, kind, future, callback)
+    
+    def poll_job(self, kind, future, callback):
+        # Superseded jobs are dropped; the newer job does its own polling
+        if self.jobs.get(kind) is not future:
+            return
+        if not future.done():
+            self.root.after(self.poll_interval, self.poll_job, kind, future, callback)
+            return
+        del self.jobs[kind]
+        self.set_busy(bool(self.jobs))
+        callback(future)
+    
+    def cancel_job(self, kind):
+        future = self.jobs.pop(kind, None)
+        if future is not None:
+            future.cancel()
+        self.set_busy(bool(self.jobs))
+    
+    def set_busy(self, busy):
+        """Show or hide the busy state while computations are running"""
+        if busy:
+            self.progress.start(10)
+            self.root.config(cursor="watch")
+        else:
+            self.progress.stop()
+            self.root.config(cursor="")
+    
+    def engine_options(self):
+        """Keyword arguments for calculus_engine.calculate shared by every plot"""
+        return {
+            "sampling": "adaptive",
+            "integrate_timeout": self.integrate_timeout,
+            "integral_mode": self.integral_mode.get(),
+            "integral_anchor": self.integral_anchor,
+            "parameters": self.parameter_values(),
+            "analysis": self.show_features.get(),
+            "complex_mode": self.complex_mode.get()
+        }
     
     def calculate_and_plot(self):
         try:
-            # Clear the plot
-            self.ax.clear()
-            
             # Get the function string and x range
             func_str = self.function_str.get()
             x_min = self.x_min.get()
@@ -485,147 +947,545 @@ class CalculusFunctionGrapher:
                 messagebox.showerror("Invalid Range", "X min must be less than X max")
                 return
             
+            # Syntax errors are reported here instead of from the worker
+            error = expression_parser.validate(func_str)
+            if error is not None:
+                messagebox.showerror("Invalid Function", str(error))
+                return
+            
             # Add to history if not already there
             if func_str not in self.function_history:
                 self.function_history.append(func_str)
                 self.history_combobox['values'] = self.function_history
+            self.executor.submit(self.store.add_history, func_str)
             
-            # Create symbolic representation
-            x = sp.symbols('x')
+            operations = [key for key, var in self.selected_operations.items() if var.get()]
             
-            # Parse the function string
-            # Replace some common syntax to make it more user-friendly
-            parse_func_str = func_str.replace('^', '**')
+            # A new plot makes any pending view resample or live update obsolete
+            self.cancel_resample()
+            self.cancel_live_update()
             
-            # Custom parsing to handle common math expressions
-            if '|' in parse_func_str:
-                # Handle absolute value syntax
-                parts = parse_func_str.split('|')
-                for i in range(1, len(parts), 2):
-                    if i < len(parts):
-                        abs_content = parts[i]
-                        parts[i] = f"abs({abs_content})"
-                parse_func_str = ''.join(parts)
+            # Stage timings and cache hits of this run, filled in by the engine and the draw below
+            profile = profiling.Profile(func_str, x_min=x_min, x_max=x_max, operations=operations)
             
-            # Replace ln with log for sympy compatibility
-            parse_func_str = parse_func_str.replace('ln(', 'log(')
+            # Parse, differentiate/integrate and sample in the headless engine off the Tk thread
+            self.submit("calculate", lambda future: self.plot_result(future, func_str, x_min, x_max, profile=profile),
+                        calculate, func_str, x_min, x_max, operations, profile=profile,
+                        **self.engine_options())
+        
+        except Exception as e:
+            messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
+    
+    def plot_result(self, future, func_str, x_min, x_max, autoscale=True, profile=None, silent=False):
+        """Show a finished calculation by updating the persistent lines
+        
+        With silent=True (live updates) errors leave the previous plot in place
+        instead of showing a message box.
+        """
+        if self.fig is None:
+            # Finished before the plot was created; show it once it is
+            self.root.after(self.poll_interval, self.plot_result, future, func_str, x_min, x_max, autoscale, profile,
+                            silent)
+            return
+        try:
+            result = future.result()
+            self.last_result = result
+            self.placeholder_text.set_visible(False)
             
-            # Convert to sympy expression with implicit multiplication
-            transformations = standard_transformations + (implicit_multiplication_application,)
-            try:
-                expr = parse_expr(parse_func_str, transformations=transformations)
-            except Exception as e:
-                # Try direct sympy parsing as fallback
-                expr = sympify(parse_func_str)
+            for operation, line in self.lines.items():
+                curve = result.curves.get(operation)
+                if curve is None or curve.error is not None:
+                    line.set_visible(False)
+                    self.imag_lines[operation].set_visible(False)
+                    continue
+                # NaN gaps keep lines from joining across poles and jumps
+                line.set_visible(True)
+                self.set_curve_data(operation, result.x_vals, curve)
             
-            # Information for display
-            func_info = []
+            if autoscale:
+                # Set limits to prevent extreme zooming
+                if result.y_limits is not None:
+                    self.ax.set_ylim(*result.y_limits)
+                    self.autoscaled_ylim = self.ax.get_ylim()
+                # Pin the x range to the sampled one; pan/zoom resamples from here
+                self.sampled_xlim = (x_min, x_max)
+                self.ax.set_xlim(x_min, x_max)
+            else:
+                self.rescale_to_visible()
+            self.plotted_function = func_str
             
-            # Create a numpy lambda function for efficient plotting
-            f = sp.lambdify(x, expr, modules=['numpy', {'log': np.log, 'ln': np.log}])
+            self.update_features(result)
+            self.update_legend()
+            self.update_info()
+            self.update_parameter_sliders(result.parameters)
             
-            # Generate x values
-            x_vals = np.linspace(x_min, x_max, 1000)
+            if profile is None:
+                # Redraw once the Tk loop is idle
+                self.canvas.draw_idle()
+            else:
+                # Draw right away so the drawing time is part of the profile
+                with profile.stage("draw"):
+                    self.canvas.draw()
+                self.record_profile(profile)
+        
+        except Exception as e:
+            if profile is not None:
+                profile.details["error"] = str(e)
+                self.record_profile(profile)
+            if silent:
+                return
+            messagebox.showerror("Error", f"An error occurred while plotting: {str(e)}")
+    
+    def record_profile(self, profile):
+        self.profiles.append(profile)
+        self.timing_label.config(text=profile.format())
+    
+    def toggle_timings(self):
+        """Show or hide the timings of the last calculation next to the function info"""
+        if self.show_timings.get():
+            self.timing_label.pack(side=tk.LEFT, padx=15)
+        else:
+            self.timing_label.pack_forget()
+    
+    def export_timings(self):
+        """Save the recorded timings of recent calculations as JSON"""
+        if not self.profiles:
+            messagebox.showinfo("Export Timings", "No calculations have been timed yet")
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if not path:
+            return
+        try:
+            profiling.export_json(self.profiles, path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save timings: {str(e)}")
+    
+    def export_large(self):
+        """Export the visible curves of the current function on export_points points
+        
+        A .npy file gets x and one row per curve; any image format gets the
+        curves drawn at high resolution. Runs on the worker pool.
+        """
+        func_str = self.function_str.get()
+        x_min = self.x_min.get()
+        x_max = self.x_max.get()
+        try:
+            points = int(self.export_points.get())
+        except (tk.TclError, ValueError):
+            points = 0
+        if points < 2:
+            messagebox.showerror("Invalid Points", "The number of points must be at least 2")
+            return
+        if x_min >= x_max:
+            messagebox.showerror("Invalid Range", "X min must be less than X max")
+            return
+        error = expression_parser.validate(func_str)
+        if error is not None:
+            messagebox.showerror("Invalid Function", str(error))
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".npy", filetypes=[
+            ("NumPy array", "*.npy"), ("PNG image", "*.png"), ("SVG image", "*.svg"), ("PDF", "*.pdf")])
+        if not path:
+            return
+        
+        operations = [key for key, var in self.selected_operations.items() if var.get()] or ["original"]
+        # Exports are real-valued: points where f is not real are NaN even in complex mode
+        options = {key: value for key, value in self.engine_options().items()
+                   if key not in ("sampling", "analysis", "complex_mode")}
+        if not path.lower().endswith(".npy"):
+            colors = self.current_theme_colors["functions"]
+            options["colors"] = [colors[calculus_operations.OPERATIONS.index(op)] for op in calculus_operations.OPERATIONS
+                                 if op in operations]
+        self.submit("export", lambda future: self.on_exported(future, path, points), export_large,
+                    path, func_str, x_min, x_max, points, operations, **options)
+    
+    def on_exported(self, future, path, points):
+        try:
+            future.result()
+        except Exception as e:
+            messagebox.showerror("Export Failed", str(e))
+            return
+        messagebox.showinfo("Export", f"Wrote {points:,} points to {path}")
+    
+    def open_surface_window(self):
+        if self.fig is None:
+            messagebox.showinfo("Surface", "The plot is still loading")
+            return
+        # Start from the current function if it already uses y
+        func_str = self.function_str.get()
+        SurfaceWindow(self, func_str if "y" in func_str else "sin(x)*cos(y)")
+    
+    def cancel_resample(self):
+        if self.resample_job is not None:
+            self.root.after_cancel(self.resample_job)
+            self.resample_job = None
+        self.cancel_job("resample")
+    
+    def cancel_live_update(self):
+        for job in (self.preview_job, self.refine_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.preview_job = None
+        self.refine_job = None
+    
+    def on_input_changed(self):
+        """In live mode, schedule a coarse preview and a full replot after the edits pause"""
+        self.cancel_live_update()
+        if not self.live_mode.get():
+            return
+        self.preview_job = self.root.after(self.preview_delay, self.live_update, True)
+        self.refine_job = self.root.after(self.refine_delay, self.live_update, False)
+    
+    def live_update(self, preview):
+        """Replot the current input if it is complete; half-typed input is skipped silently"""
+        if preview:
+            self.preview_job = None
+        else:
+            self.refine_job = None
+        try:
+            func_str = self.function_str.get()
+            x_min = self.x_min.get()
+            x_max = self.x_max.get()
+        except tk.TclError:
+            # A range entry holding something like "-" or ""
+            return
+        if self.fig is None or x_min >= x_max or not func_str.strip() or expression_parser.validate(func_str):
+            return
+        operations = [key for key, var in self.selected_operations.items() if var.get()]
+        
+        options = self.engine_options()
+        if preview:
+            options["num_points"] = self.preview_points
+            if "integral" in operations and options["integral_mode"] != "numeric":
+                # A symbolic integral can take seconds; the preview integrates the samples instead
+                options["integral_mode"] = "numeric"
+        
+        # Symbolic results are cached, so an edited range or a repeated function only resamples.
+        # Submitting as "calculate" supersedes any computation still running for older input.
+        self.cancel_resample()
+        self.submit("calculate", lambda future: self.plot_result(future, func_str, x_min, x_max, silent=True),
+                    calculate, func_str, x_min, x_max, operations, **options)
+    
+    def on_xlim_changed(self, ax):
+        """Schedule a resample of the visible x window once panning/zooming pauses"""
+        if self.resample_job is not None:
+            self.root.after_cancel(self.resample_job)
+        self.resample_job = self.root.after(self.resample_delay, self.resample_view)
+    
+    def resample_view(self):
+        """Resample the plotted curves over the visible x window in the background"""
+        self.resample_job = None
+        view_min, view_max = self.ax.get_xlim()
+        if (view_min, view_max) == self.sampled_xlim:
+            return
+        self.sampled_xlim = (view_min, view_max)
+        self.resample(view_min, view_max)
+    
+    def resample(self, view_min, view_max):
+        """Resample the main curves and every overlay in place, keeping the axes as they are"""
+        # Symbolic results and compiled callables come from the engine's cache
+        operations = self.visible_operations()
+        if operations:
+            self.submit("resample", lambda future: self.update_lines(future, view_min, view_max),
+                        calculate, self.plotted_function, view_min, view_max,
+                        operations, **self.engine_options())
+        for func_str in self.overlays:
+            self.sample_overlay(func_str, view_min, view_max)
+    
+    def update_lines(self, future, view_min, view_max):
+        """Update the plotted lines in place with resampled data"""
+        try:
+            result = future.result()
+        except Exception:
+            # Keep showing the previous samples
+            return
+        
+        for operation, curve in result.curves.items():
+            if curve.error is None:
+                self.set_curve_data(operation, result.x_vals, curve)
+        
+        # Switching complex mode on or off changes which lines exist
+        mode_changed = result.complex_mode != self.last_result.complex_mode
+        if mode_changed:
+            self.update_legend()
+        self.last_result = result
+        self.update_features(result)
+        if result.features is not None or mode_changed:
+            self.update_info()
+        self.canvas.draw_idle()
+    
+    def update_parameter_sliders(self, parameters):
+        """Show one slider per parameter in parameters (name -> value used)"""
+        names = tuple(parameters)
+        if names == self.parameter_names and self.parameter_frame.winfo_children():
+            return
+        self.parameter_names = names
+        for child in self.parameter_frame.winfo_children():
+            child.destroy()
+        self.parameter_labels = {}
+        
+        if not names:
+            hint = ttb.Label(self.parameter_frame, text="Letters other than x, e.g. a*sin(b*x), get a slider",
+                             font=("Arial", 9), wraplength=250)
+            hint.pack(fill=tk.X, padx=10, pady=10)
+            return
+        
+        for name, value in parameters.items():
+            if name not in self.parameter_vars:
+                self.parameter_vars[name] = tk.DoubleVar(value=value)
+            var = self.parameter_vars[name]
             
-            # Calculate y values, handling potential errors
-            try:
-                y_vals = f(x_vals)
-                # Remove infinities and NaNs
-                mask = np.isfinite(y_vals)
-                x_vals_clean = x_vals[mask]
-                y_vals_clean = y_vals[mask]
-                
-                # Find reasonable y-axis limits to prevent extreme zooming
-                if len(y_vals_clean) > 0:
-                    y_range = np.percentile(y_vals_clean, [5, 95])
-                    y_padding = (y_range[1] - y_range[0]) * 0.2
-                    y_min = y_range[0] - y_padding
-                    y_max = y_range[1] + y_padding
-                    
-                    # Set limits but only if they're reasonable
-                    if np.isfinite(y_min) and np.isfinite(y_max) and y_min < y_max:
-                        self.ax.set_ylim(y_min, y_max)
-                
-                # Plot original function if selected
-                if self.selected_operations["original"].get():
-                    self.ax.plot(x_vals_clean, y_vals_clean, label='f(x)', 
-                              color=self.current_theme_colors["functions"][0],
-                              linewidth=2, alpha=0.9)  # slightly transparent for glass effect
-                    func_info.append(f"f(x) = {sp.pretty(expr)}")
-                
-                # Calculate and plot first derivative if selected
-                if self.selected_operations["first_derivative"].get():
-                    f_prime = sp.diff(expr, x)
-                    f_prime_func = sp.lambdify(x, f_prime, modules=['numpy', {'log': np.log, 'ln': np.log}])
-                    try:
-                        y_prime = f_prime_func(x_vals)
-                        mask = np.isfinite(y_prime)
-                        self.ax.plot(x_vals[mask], y_prime[mask], label="f'(x)", 
-                                  color=self.current_theme_colors["functions"][1],
-                                  linewidth=2, alpha=0.9)
-                        func_info.append(f"f'(x) = {sp.pretty(f_prime)}")
-                    except Exception as e:
-                        func_info.append(f"f'(x) = {sp.pretty(f_prime)} (Error plotting: {str(e)})")
-                
-                # Calculate and plot second derivative if selected
-                if self.selected_operations["second_derivative"].get():
-                    f_double_prime = sp.diff(expr, x, 2)
-                    f_double_prime_func = sp.lambdify(x, f_double_prime, modules=['numpy', {'log': np.log, 'ln': np.log}])
-                    try:
-                        y_double_prime = f_double_prime_func(x_vals)
-                        mask = np.isfinite(y_double_prime)
-                        self.ax.plot(x_vals[mask], y_double_prime[mask], label="f''(x)", 
-                                  color=self.current_theme_colors["functions"][2],
-                                  linewidth=2, alpha=0.9)
-                        func_info.append(f"f''(x) = {sp.pretty(f_double_prime)}")
-                    except Exception as e:
-                        func_info.append(f"f''(x) = {sp.pretty(f_double_prime)} (Error plotting: {str(e)})")
-                
-                # Calculate and plot third derivative if selected
-                if self.selected_operations["third_derivative"].get():
-                    f_triple_prime = sp.diff(expr, x, 3)
-                    f_triple_prime_func = sp.lambdify(x, f_triple_prime, modules=['numpy', {'log': np.log, 'ln': np.log}])
-                    try:
-                        y_triple_prime = f_triple_prime_func(x_vals)
-                        mask = np.isfinite(y_triple_prime)
-                        self.ax.plot(x_vals[mask], y_triple_prime[mask], label="f'''(x)", 
-                                  color=self.current_theme_colors["functions"][3],
-                                  linewidth=2, alpha=0.9)
-                        func_info.append(f"f'''(x) = {sp.pretty(f_triple_prime)}")
-                    except Exception as e:                        func_info.append(f"f'''(x) = {sp.pretty(f_triple_prime)} (Error plotting: {str(e)})")
-                
-                # Calculate and plot integral if selected
-                if self.selected_operations["integral"].get():
-                    f_integral = sp.integrate(expr, x)
-                    f_integral_func = sp.lambdify(x, f_integral, modules=['numpy', {'log': np.log, 'ln': np.log}])
-                    try:
-                        y_integral = f_integral_func(x_vals)
-                        mask = np.isfinite(y_integral)
-                        self.ax.plot(x_vals[mask], y_integral[mask], label="∫f(x)dx", 
-                                     color=self.current_theme_colors["functions"][4],
-                                     linewidth=2, alpha=0.9)
-                        func_info.append(f"∫f(x)dx = {sp.pretty(f_integral)}")
-                    except Exception as e:
-                        func_info.append(f"∫f(x)dx = {sp.pretty(f_integral)} (Error plotting: {str(e)})")
-                
-                # Add legend and grid
-                self.ax.legend(loc="upper right", fontsize=10, frameon=False)
-                self.ax.grid(True, color=self.current_theme_colors["grid"], linestyle='--', alpha=0.7)
-                
-                # Update function information display
-                self.func_info_label.config(text="\n".join(func_info))
-                
-                # Refresh the canvas
-                self.canvas.draw()
+            row_frame = ttb.Frame(self.parameter_frame)
+            row_frame.pack(fill=tk.X, padx=10, pady=2)
+            
+            name_label = ttb.Label(row_frame, text=f"{name} =", width=4)
+            name_label.pack(side=tk.LEFT)
             
-            except Exception as e:
-                messagebox.showerror("Error", f"An error occurred while plotting: {str(e)}")
+            value_label = ttb.Label(row_frame, text=f"{var.get():.2f}", width=6)
+            value_label.pack(side=tk.RIGHT)
+            self.parameter_labels[name] = value_label
+            
+            slider = ttb.Scale(row_frame, from_=self.parameter_range[0], to=self.parameter_range[1], variable=var,
+                               bootstyle="dark", command=lambda value: self.on_parameter_changed())
+            slider.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+    
+    def parameter_values(self):
+        """Every slider value seen so far; the engine ignores names the function does not use
+        
+        A newly submitted function is calculated before its sliders are
+        rebuilt, so limiting this to the current sliders would plot 1.0 for a
+        parameter whose slider (kept from an earlier function) shows another value.
+        """
+        return {name: var.get() for name, var in self.parameter_vars.items()}
+    
+    def on_parameter_changed(self):
+        """Coalesce slider motion; only the compiled kernels are re-evaluated"""
+        for name, label in self.parameter_labels.items():
+            label.config(text=f"{self.parameter_vars[name].get():.2f}")
+        if self.parameter_job is None:
+            self.parameter_job = self.root.after(self.parameter_delay, self.apply_parameters)
+    
+    def apply_parameters(self):
+        self.parameter_job = None
+        if self.plotted_function is None or self.sampled_xlim is None:
+            return
+        self.resample(*self.sampled_xlim)
+    
+    def add_overlay(self):
+        """Overlay the current function and selected operations on the plot
         
+        Only the new function is sampled; the other curves are left alone.
+        """
+        func_str = self.function_str.get()
+        operations = [key for key, var in self.selected_operations.items() if var.get()]
+        if self.fig is None or not func_str.strip() or not operations:
+            return
+        
+        # Adding a function again replaces its operations
+        self.remove_overlay_lines(func_str)
+        linestyle = self.overlay_styles[len(self.overlays) % len(self.overlay_styles)]
+        lines = {}
+        for operation in operations:
+            index = calculus_operations.OPERATIONS.index(operation)
+            lines[operation], = self.ax.plot([], [], label=f"{calculus_operations.LABELS[operation]}: {func_str}",
+                                             color=self.current_theme_colors["functions"][index],
+                                             linestyle=linestyle, linewidth=1.5, alpha=0.9, visible=False)
+        self.overlays[func_str] = lines
+        self.overlay_combobox['values'] = list(self.overlays)
+        self.overlay_combobox.set(func_str)
+        
+        # With nothing plotted yet, start from the entered range
+        if self.sampled_xlim is None:
+            self.sampled_xlim = (self.x_min.get(), self.x_max.get())
+            self.ax.set_xlim(*self.sampled_xlim)
+        self.sample_overlay(func_str, *self.sampled_xlim)
+    
+    def remove_overlay(self):
+        """Remove the overlay selected in the overlay list without recomputing anything"""
+        func_str = self.overlay_combobox.get()
+        if func_str not in self.overlays:
+            return
+        self.remove_overlay_lines(func_str)
+        self.overlay_combobox['values'] = list(self.overlays)
+        self.overlay_combobox.set(next(iter(self.overlays), ""))
+        self.update_legend()
+        self.canvas.draw_idle()
+    
+    def remove_overlay_lines(self, func_str):
+        lines = self.overlays.pop(func_str, None)
+        if lines is None:
+            return
+        self.cancel_job(f"overlay:{func_str}")
+        for line in lines.values():
+            line.remove()
+    
+    def sample_overlay(self, func_str, view_min, view_max):
+        lines = self.overlays[func_str]
+        self.submit(f"overlay:{func_str}", lambda future: self.update_overlay_lines(future, func_str),
+                    calculate, func_str, view_min, view_max, list(lines),
+                    **self.engine_options())
+    
+    def update_overlay_lines(self, future, func_str):
+        """Show a finished overlay sample"""
+        lines = self.overlays.get(func_str)
+        if lines is None:
+            # Removed while it was being sampled
+            return
+        try:
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {str(e)}")
+            self.remove_overlay_lines(func_str)
+            self.overlay_combobox['values'] = list(self.overlays)
+            messagebox.showerror("Error", f"Could not overlay {func_str}: {str(e)}")
+            return
+        
+        for operation, line in lines.items():
+            curve = result.curves.get(operation)
+            if curve is None or curve.error is not None:
+                line.set_visible(False)
+                continue
+            line.set_data(result.x_vals, curve.plot_values)
+            line.set_visible(True)
+        
+        self.placeholder_text.set_visible(False)
+        self.update_legend()
+        self.canvas.draw_idle()
+
+
+class SurfaceWindow:
+    """Window showing one quantity of f(x, y) as a heatmap or 3D surface, optionally with gradient arrows
+    
+    Computation runs on the grapher's worker pool; the symbolic partial
+    derivatives, gradient and Hessian are listed below the plot.
+    """
+    
+    def __init__(self, app, func_str):
+        self.app = app
+        self.window = tk.Toplevel(app.root)
+        self.window.title("Surface f(x, y)")
+        self.window.geometry("900x700")
+        
+        self.function_str = StringVar(value=func_str)
+        self.x_min = tk.DoubleVar(value=-3)
+        self.x_max = tk.DoubleVar(value=3)
+        self.y_min = tk.DoubleVar(value=-3)
+        self.y_max = tk.DoubleVar(value=3)
+        self.resolution = tk.IntVar(value=1000)
+        self.quantity = StringVar(value=calculus_operations.SURFACE_LABELS["original"])
+        self.view = StringVar(value="heatmap")
+        self.show_field = tk.BooleanVar(value=False)
+        self.field_resolution = 24
+        self.result = None
+        
+        controls = ttb.Frame(self.window)
+        controls.pack(fill=tk.X, padx=10, pady=10)
+        
+        ttb.Label(controls, text="f(x, y) =").pack(side=tk.LEFT)
+        function_entry = ttb.Entry(controls, textvariable=self.function_str, width=30)
+        function_entry.pack(side=tk.LEFT, padx=5)
+        function_entry.bind("<Return>", lambda event: self.calculate())
+        
+        for label, variable in (("x:", self.x_min), ("to", self.x_max), ("y:", self.y_min), ("to", self.y_max)):
+            ttb.Label(controls, text=label).pack(side=tk.LEFT, padx=(5, 2))
+            ttb.Entry(controls, textvariable=variable, width=6).pack(side=tk.LEFT)
+        
+        ttb.Label(controls, text="Grid:").pack(side=tk.LEFT, padx=(10, 2))
+        ttb.Entry(controls, textvariable=self.resolution, width=6).pack(side=tk.LEFT)
+        
+        options = ttb.Frame(self.window)
+        options.pack(fill=tk.X, padx=10)
+        
+        quantity_combobox = ttb.Combobox(options, textvariable=self.quantity, state="readonly", width=10,
+                                         values=[calculus_operations.SURFACE_LABELS[operation]
+                                                 for operation in calculus_operations.SURFACE_OPERATIONS],
+                                         bootstyle="dark")
+        quantity_combobox.pack(side=tk.LEFT)
+        quantity_combobox.bind("<<ComboboxSelected>>", lambda event: self.calculate())
+        
+        for text, value in (("Heatmap", "heatmap"), ("Surface", "surface")):
+            ttb.Radiobutton(options, text=text, variable=self.view, value=value, command=self.draw,
+                            bootstyle="toolbutton").pack(side=tk.LEFT, padx=(5, 0))
+        
+        ttb.Checkbutton(options, text="Gradient field", variable=self.show_field, command=self.calculate,
+                        bootstyle="round-toggle").pack(side=tk.LEFT, padx=10)
+        
+        ttb.Button(options, text="Plot", command=self.calculate, bootstyle="success").pack(side=tk.RIGHT)
+        
+        Figure, FigureCanvasTkAgg, _ = load_plotting()
+        self.fig = Figure(figsize=(6, 5), facecolor=app.current_theme_colors["bg"])
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.window)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+        
+        self.info_label = ttb.Label(self.window, text="", font=("Arial", 9), anchor=tk.W, justify=tk.LEFT)
+        self.info_label.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
+        self.calculate()
+    
+    def operation(self):
+        labels = {label: operation for operation, label in calculus_operations.SURFACE_LABELS.items()}
+        return labels[self.quantity.get()]
+    
+    def calculate(self):
+        try:
+            x_min, x_max = self.x_min.get(), self.x_max.get()
+            y_min, y_max = self.y_min.get(), self.y_max.get()
+            resolution = int(self.resolution.get())
+        except (tk.TclError, ValueError):
+            messagebox.showerror("Invalid Input", "Ranges and grid size must be numbers", parent=self.window)
+            return
+        func_str = self.function_str.get()
+        error = expression_parser.validate(func_str)
+        if error is not None:
+            messagebox.showerror("Invalid Function", str(error), parent=self.window)
+            return
+        self.app.submit("surface", self.on_calculated, calculate_surface, func_str, x_min, x_max, y_min, y_max,
+                        [self.operation()], max(resolution, 2), self.app.parameter_values(),
+                        self.field_resolution if self.show_field.get() else None)
+    
+    def on_calculated(self, future):
+        try:
+            self.result = future.result()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not evaluate the surface: {str(e)}", parent=self.window)
+            return
+        self.draw()
+    
+    def draw(self):
+        """Show the last result in the selected view; decimated, so this is cheap for any grid size"""
+        result = self.result
+        if result is None:
+            return
+        operation = next(iter(result.grids))
+        colors = self.app.current_theme_colors
+        limits = result.limits(operation) or (None, None)
+        
+        self.fig.clear()
+        if self.view.get() == "surface":
+            ax = self.fig.add_subplot(111, projection="3d")
+            x_mesh, y_mesh, z_grid = result.surface(operation)
+            ax.plot_surface(x_mesh, y_mesh, z_grid, cmap="viridis", vmin=limits[0], vmax=limits[1],
+                            linewidth=0, antialiased=False)
+        else:
+            ax = self.fig.add_subplot(111)
+            grid, extent = result.image(operation)
+            image = ax.imshow(grid, origin="lower", extent=extent, aspect="auto", cmap="viridis",
+                              vmin=limits[0], vmax=limits[1])
+            self.fig.colorbar(image, ax=ax)
+            if result.field is not None:
+                ax.quiver(*result.field, color=colors["text"], alpha=0.7)
+        ax.set_facecolor(colors["plot_bg"])
+        ax.set_xlabel("x", color=colors["text"])
+        ax.set_ylabel("y", color=colors["text"])
+        ax.set_title(calculus_operations.SURFACE_LABELS[operation], color=colors["text"])
+        ax.tick_params(colors=colors["text"])
+        self.canvas.draw_idle()
+        
+        import surface_engine
+        self.info_label.config(text="\n".join(surface_engine.describe(result)))
 
 
 if __name__ == "__main__":
     root = ttb.Window(themename="darkly")
-    app = CalculusFunctionGrapher(root)
+    # --startup-time prints how long the window, plot and engine took to load, then quits
+    app = CalculusFunctionGrapher(root, report_startup="--startup-time" in sys.argv)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,303 @@
+"""Export functions sampled on very large grids without holding the samples in memory.
+
+The compiled callables of the engine are evaluated over fixed-size chunks
+of the grid, so memory use depends on the chunk size rather than on the
+number of points. Chunks are streamed straight into an .npy file (which
+np.load can memory-map), or reduced to the minimum and maximum of every
+pixel column for a high-resolution image, which looks the same as
+plotting every point.
+
+    python large_export.py "sin(x)/x" -o sinc.npy --points 100000000
+    python large_export.py "x^2*sin(1/x)" -o wiggle.png --points 10000000 --dpi 600
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import sympy as sp
+
+import autoscale
+import calculus_engine
+from calculus_operations import INTEGRAL_MODES, LABELS, OPERATIONS
+from numeric_integration import METHODS, cumulative_integral, quadrature
+
+DEFAULT_CHUNK_SIZE = 1 << 18
+DEFAULT_POINTS = 10_000_000
+DEFAULT_IMAGE_SIZE = (3200, 1800)
+DEFAULT_DPI = 300
+IMAGE_FORMATS = [".png", ".svg", ".pdf", ".jpg", ".jpeg", ".tif", ".tiff"]
+
+
+class ChunkedEvaluator:
+    """Evaluates the requested operations of one function over a grid, chunk by chunk
+
+    The symbolic work goes through the engine's cache as in
+    calculus_engine.calculate, and all curves of a chunk come from one fused
+    kernel. Integrals without a usable closed form are integrated
+    numerically, carrying the running total from one chunk to the next;
+    they are zero at integral_anchor (x_min by default). Operations that
+    fail to compile or evaluate are NaN.
+    """
+
+    def __init__(self, func_str, operations=("original",), parameters=None, cache=None, integral_mode="auto",
+                 integral_method="simpson", integrate_timeout=None, integral_anchor=None):
+        if integral_mode not in INTEGRAL_MODES:
+            raise ValueError(f"Unknown integral mode: {integral_mode}")
+        if integral_method not in METHODS:
+            raise ValueError(f"Unknown integration method: {integral_method}")
+        cache = calculus_engine.symbolic_cache if cache is None else cache
+        self.entry = cache.get(func_str)
+        self.operations = [operation for operation in OPERATIONS if operation in operations]
+        parameters = parameters or {}
+        self.values = tuple(float(parameters.get(str(symbol), calculus_engine.DEFAULT_PARAMETER_VALUE))
+                            for symbol in self.entry.parameters)
+        self.integral_method = integral_method
+        self.integral_anchor = integral_anchor
+
+        self.numeric_integral = "integral" in self.operations and integral_mode == "numeric"
+        integral_error = None
+        if "integral" in self.operations and integral_mode != "numeric" and \
+                self.entry.integral(integrate_timeout).has(sp.Integral):
+            if integral_mode == "auto":
+                self.numeric_integral = True
+            else:
+                integral_error = calculus_engine.missing_closed_form(self.entry, integrate_timeout)
+        evaluated = ["original"] + [operation for operation in self.operations if operation != "original" and not (
+            operation == "integral" and (self.numeric_integral or integral_error is not None))]
+        self.func, self.fused_operations, errors = self.entry.fused_callable(evaluated)
+        # A copy, as the entry keeps the dict with the compiled function
+        self.errors = dict(errors)
+        if integral_error is not None:
+            self.errors["integral"] = integral_error
+        if "original" in self.errors:
+            raise self.errors["original"]
+        # Closed forms that fail to compile or evaluate (Si has no NumPy function) also fall back in auto mode
+        if integral_mode == "auto" and "integral" in evaluated and (
+                "integral" in self.errors or not self.evaluates("integral")):
+            self.numeric_integral = True
+            evaluated.remove("integral")
+            self.func, self.fused_operations, errors = self.entry.fused_callable(evaluated)
+            self.errors = dict(errors)
+
+    def evaluates(self, operation):
+        """Whether the compiled operation runs with NumPy, tried on a few points
+
+        Values may be NaN; only a failure to evaluate at all counts.
+        """
+        try:
+            calculus_engine.evaluate(self.entry.callable(operation), np.linspace(-1.0, 1.0, 4), self.values)
+        except Exception:
+            return False
+        return True
+
+    def chunks(self, x_min, x_max, num_points, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Yield (start, x_chunk, {operation: y_chunk}) covering num_points evenly spaced points
+
+        The points are those of np.linspace(x_min, x_max, num_points).
+        """
+        if x_min >= x_max:
+            raise ValueError("X min must be less than X max")
+        if num_points < 2:
+            raise ValueError("At least 2 points are needed")
+        step = (x_max - x_min) / (num_points - 1)
+        carry = self.integral_offset(x_min)
+        previous = None
+        for start in range(0, num_points, chunk_size):
+            stop = min(start + chunk_size, num_points)
+            x_chunk = x_min + np.arange(start, stop) * step
+            if stop == num_points:
+                x_chunk[-1] = x_max
+            samples = self.evaluate(x_chunk)
+            if self.numeric_integral:
+                samples["integral"], carry = self.integrate_chunk(x_chunk, samples["original"], previous, carry)
+                previous = (x_chunk[-1], samples["original"][-1])
+            yield start, x_chunk, {operation: samples[operation] for operation in self.operations}
+
+    def evaluate(self, x_chunk):
+        nan = np.full(x_chunk.shape, np.nan)
+        samples = dict.fromkeys(self.errors, nan)
+        try:
+            samples.update(zip(self.fused_operations,
+                               calculus_engine.evaluate_fused(self.func, x_chunk, self.values)))
+        except Exception:
+            for operation in self.fused_operations:
+                try:
+                    samples[operation] = calculus_engine.evaluate(self.entry.callable(operation), x_chunk,
+                                                                  self.values)
+                except Exception:
+                    if operation == "original":
+                        raise
+                    samples[operation] = nan
+        return samples
+
+    def integral_offset(self, x_min):
+        """Value of the numeric integral at x_min, so it is zero at integral_anchor"""
+        if not self.numeric_integral or self.integral_anchor is None or self.integral_anchor == x_min:
+            return 0.0
+        original = self.entry.callable("original")
+        offset, error = quadrature(lambda points: original(points, *self.values), self.integral_anchor, x_min)
+        return offset if np.isfinite(offset) and np.isfinite(error) else 0.0
+
+    def integrate_chunk(self, x_chunk, y_chunk, previous, carry):
+        """Numeric integral over x_chunk continuing from the last point of the previous chunk
+
+        Returns (values, carry) where carry is the running total to continue from.
+        """
+        if previous is not None:
+            x_chunk = np.concatenate(([previous[0]], x_chunk))
+            y_chunk = np.concatenate(([previous[1]], y_chunk))
+        values, _ = cumulative_integral(x_chunk, y_chunk, self.integral_method)
+        values += carry
+        # Segments after the last finite sample add nothing, so the total continues from there
+        finite = np.flatnonzero(np.isfinite(values))
+        if len(finite):
+            carry = float(values[finite[-1]])
+        return (values[1:] if previous is not None else values), carry
+
+
+class MinMaxDecimator:
+    """Per-column minimum and maximum of a curve, updated one sorted chunk at a time
+
+    Drawing a vertical segment from the minimum to the maximum of every
+    column looks the same as drawing every sample, for any number of samples.
+    """
+
+    def __init__(self, x_min, x_max, bins):
+        self.x_min = x_min
+        self.x_max = x_max
+        self.bins = bins
+        self.mins = np.full(bins, np.nan)
+        self.maxs = np.full(bins, np.nan)
+
+    def add(self, x_chunk, y_chunk):
+        columns = ((x_chunk - self.x_min) * (self.bins / (self.x_max - self.x_min))).astype(np.intp)
+        np.clip(columns, 0, self.bins - 1, out=columns)
+        y_chunk = np.where(np.isfinite(y_chunk), y_chunk, np.nan)
+        # x is sorted, so each column is one contiguous run of the chunk
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+        ids = columns[starts]
+        # fmin/fmax ignore NaN, so gaps only show where a whole column is undefined
+        self.mins[ids] = np.fmin(self.mins[ids], np.fmin.reduceat(y_chunk, starts))
+        self.maxs[ids] = np.fmax(self.maxs[ids], np.fmax.reduceat(y_chunk, starts))
+
+    def envelope(self):
+        """Return (x, y) tracing min and max of every column in turn"""
+        centers = self.x_min + (np.arange(self.bins) + 0.5) * ((self.x_max - self.x_min) / self.bins)
+        return np.repeat(centers, 2), np.column_stack((self.mins, self.maxs)).ravel()
+
+
+def export_npy(path, func_str, x_min, x_max, num_points=DEFAULT_POINTS, operations=("original",),
+               chunk_size=DEFAULT_CHUNK_SIZE, progress=None, **options):
+    """Stream the samples into a .npy file at path and return its row names
+
+    The array has shape (1 + number of operations, num_points): x in row 0,
+    then one row per operation in OPERATIONS order. It is stored in Fortran
+    order, so every chunk is one contiguous write and nothing but the chunk
+    is held in memory; np.load(path, mmap_mode="r") reads it back without
+    loading it. options are passed to ChunkedEvaluator. progress, if given,
+    is called with the number of points written so far after every chunk.
+    """
+    evaluator = ChunkedEvaluator(func_str, operations, **options)
+    rows = ["x"] + evaluator.operations
+    header = {"descr": np.lib.format.dtype_to_descr(np.dtype("<f8")), "fortran_order": True,
+              "shape": (len(rows), num_points)}
+    with open(path, "wb") as f:
+        np.lib.format.write_array_header_2_0(f, header)
+        for start, x_chunk, samples in evaluator.chunks(x_min, x_max, num_points, chunk_size):
+            # Fortran order stores all rows of a point together
+            block = np.column_stack([x_chunk] + [samples[operation] for operation in evaluator.operations])
+            f.write(block.astype("<f8", copy=False).tobytes())
+            if progress is not None:
+                progress(start + len(x_chunk))
+    return rows
+
+
+def export_image(path, func_str, x_min, x_max, num_points=DEFAULT_POINTS, operations=("original",),
+                 size=DEFAULT_IMAGE_SIZE, dpi=DEFAULT_DPI, chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+                 colors=None, **options):
+    """Render the curves at size (width, height) pixels to path, decimated to min/max per pixel column
+
+    The y limits are robust limits over all curves, as in the grapher.
+    colors optionally lists one matplotlib color per operation.
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    evaluator = ChunkedEvaluator(func_str, operations, **options)
+    width, height = size
+    decimators = {operation: MinMaxDecimator(x_min, x_max, width) for operation in evaluator.operations}
+    for start, x_chunk, samples in evaluator.chunks(x_min, x_max, num_points, chunk_size):
+        for operation, decimator in decimators.items():
+            decimator.add(x_chunk, samples[operation])
+        if progress is not None:
+            progress(start + len(x_chunk))
+
+    fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ranges = []
+    for i, (operation, decimator) in enumerate(decimators.items()):
+        x_vals, y_vals = decimator.envelope()
+        color = colors[i % len(colors)] if colors else None
+        ax.plot(x_vals, y_vals, color=color, linewidth=0.6, label=LABELS[operation])
+        ranges.append(autoscale.robust_range(y_vals, x_vals)[0])
+    limits = autoscale.combine(ranges)
+    if limits is not None:
+        ax.set_ylim(*limits)
+    ax.set_xlim(x_min, x_max)
+    ax.grid(True, alpha=0.3)
+    ax.set_title(f"f(x) = {func_str}  ({num_points:,} points)")
+    ax.legend(loc="upper right")
+    fig.savefig(path, dpi=dpi)
+    return list(decimators)
+
+
+def export(path, *args, **kwargs):
+    """Export to path as .npy samples or, for an image extension, as a rendered plot"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return export_npy(path, *args, **kwargs)
+    if extension in IMAGE_FORMATS:
+        return export_image(path, *args, **kwargs)
+    raise ValueError(f"Unsupported export format '{extension}', use .npy or one of {', '.join(IMAGE_FORMATS)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a function sampled on a very large grid")
+    parser.add_argument("function", help="function of x, e.g. \"sin(x)/x\"")
+    parser.add_argument("-o", "--output", required=True, help=".npy file or image (" + ", ".join(IMAGE_FORMATS) + ")")
+    parser.add_argument("--x-min", type=float, default=-10.0)
+    parser.add_argument("--x-max", type=float, default=10.0)
+    parser.add_argument("--points", type=int, default=DEFAULT_POINTS)
+    parser.add_argument("--operations", default="original",
+                        help="comma separated subset of: " + ", ".join(OPERATIONS))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--integral-mode", choices=INTEGRAL_MODES, default="auto")
+    parser.add_argument("--integrate-timeout", type=float, default=None,
+                        help="seconds before an integral falls back to numeric integration")
+    parser.add_argument("--width", type=int, default=DEFAULT_IMAGE_SIZE[0], help="image width in pixels")
+    parser.add_argument("--height", type=int, default=DEFAULT_IMAGE_SIZE[1], help="image height in pixels")
+    parser.add_argument("--dpi", type=int, default=DEFAULT_DPI)
+    args = parser.parse_args(argv)
+
+    operations = [operation.strip() for operation in args.operations.split(',') if operation.strip()]
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error("unknown operations: " + ", ".join(sorted(unknown)))
+
+    options = {"operations": operations, "chunk_size": args.chunk_size, "integral_mode": args.integral_mode,
+               "integrate_timeout": args.integrate_timeout}
+    if os.path.splitext(args.output)[1].lower() != ".npy":
+        options.update(size=(args.width, args.height), dpi=args.dpi)
+    try:
+        rows = export(args.output, args.function, args.x_min, args.x_max, args.points, **options)
+    except Exception as e:
+        print(f"Export failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Wrote {args.points:,} points of {', '.join(rows)} to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""Numeric antiderivatives for when sympy has no usable closed form.
+
+The cumulative rules work directly on already sampled values, on uniform or
+adaptive (non-uniform) grids, so an integral curve costs one pass over the
+samples. Quadrature is only used to shift the result so it is anchored at a
+point outside the sampled range.
+"""
+import numpy as np
+
+METHODS = ["simpson", "trapezoid"]
+QUADRATURE_ORDER = 8
+QUADRATURE_TOLERANCE = 1e-10
+MAX_QUADRATURE_PANELS = 4096
+
+
+def trapezoid_segments(x_vals, y_vals):
+    """Integral of the straight line over every segment"""
+    return (y_vals[:-1] + y_vals[1:]) / 2 * np.diff(x_vals)
+
+
+def simpson_segments(x_vals, y_vals):
+    """Integral over every segment of the parabola through it and one neighbouring point
+
+    The next point is used as the third node, the previous one for the last
+    segment. Nodes are shifted to the segment start so the weights stay
+    accurate for short segments far from zero.
+    """
+    n = len(x_vals)
+    i = np.arange(n - 1)
+    third = np.where(i + 2 < n, i + 2, i - 1)
+    h = x_vals[i + 1] - x_vals[i]
+    d = x_vals[third] - x_vals[i]
+
+    def basis_integral(p, q):
+        # Integral of (u - p) * (u - q) for u from 0 to h
+        return h ** 3 / 3 - (p + q) * h ** 2 / 2 + p * q * h
+
+    w0 = basis_integral(h, d) / (h * d)
+    w1 = basis_integral(0, d) / (h * (h - d))
+    w2 = basis_integral(0, h) / (d * (d - h))
+    return w0 * y_vals[i] + w1 * y_vals[i + 1] + w2 * y_vals[third]
+
+
+def cumulative_integral(x_vals, y_vals, method="simpson"):
+    """Numeric antiderivative of sampled y_vals, zero at x_vals[0]
+
+    Returns (values, error): error is the cumulative difference between the
+    Simpson and trapezoid rules, an estimate of the trapezoid error and a
+    conservative one for Simpson. Segments with a non-finite end point
+    contribute nothing, and values is NaN wherever y_vals is not finite.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown integration method: {method}")
+    finite = np.isfinite(y_vals)
+    if len(x_vals) < 2:
+        return np.where(finite, 0.0, np.nan), np.zeros(len(x_vals))
+
+    y_filled = np.where(finite, y_vals, 0.0)
+    valid = finite[:-1] & finite[1:]
+    trapezoid = np.where(valid, trapezoid_segments(x_vals, y_filled), 0.0)
+    if len(x_vals) > 2:
+        simpson = simpson_segments(x_vals, y_filled)
+        # Parabolas through a gap fall back to the straight line
+        n = len(x_vals)
+        i = np.arange(n - 1)
+        third = np.where(i + 2 < n, i + 2, i - 1)
+        simpson = np.where(valid & finite[third], simpson, trapezoid)
+    else:
+        simpson = trapezoid
+
+    segments = simpson if method == "simpson" else trapezoid
+    values = np.concatenate(([0.0], np.cumsum(segments)))
+    error = np.concatenate(([0.0], np.cumsum(np.abs(simpson - trapezoid))))
+    return np.where(finite, values, np.nan), error
+
+
+def quadrature(func, a, b, tolerance=QUADRATURE_TOLERANCE):
+    """Integrate a vectorized func from a to b
+
+    Composite Gauss-Legendre with the number of panels doubled until two
+    successive estimates agree. Returns (value, error); value is NaN if the
+    integrand is not finite on [a, b].
+    """
+    if a == b:
+        return 0.0, 0.0
+    nodes, weights = np.polynomial.legendre.leggauss(QUADRATURE_ORDER)
+    previous = None
+    panels = 1
+    while panels <= MAX_QUADRATURE_PANELS:
+        edges = np.linspace(a, b, panels + 1)
+        half = np.diff(edges) / 2
+        mid = (edges[:-1] + edges[1:]) / 2
+        points = (mid[:, None] + half[:, None] * nodes).ravel()
+        with np.errstate(all='ignore'):
+            values = np.broadcast_to(np.asarray(func(points), dtype=float), points.shape)
+        if not np.all(np.isfinite(values)):
+            return np.nan, np.inf
+        total = float(np.sum(values.reshape(panels, -1) @ weights * half))
+        if previous is not None and abs(total - previous) <= tolerance * max(1.0, abs(total)):
+            return total, abs(total - previous)
+        previous = total
+        panels *= 2
+    return previous, np.inf
+
+
+def antiderivative(x_vals, y_vals, method="simpson", anchor=None, func=None):
+    """Numeric antiderivative of sampled y_vals that is zero at anchor
+
+    anchor defaults to x_vals[0]. If func (the compiled integrand) is given,
+    the offset from anchor to x_vals[0] is computed by quadrature, so the
+    anchor may lie outside the sampled range and panning keeps the curve in
+    place; without func the sampled values are interpolated at the anchor.
+    If the offset cannot be computed the curve stays anchored at x_vals[0].
+
+    Returns (values, error_estimate), where error_estimate is the largest
+    estimated absolute error over the range.
+    """
+    values, error = cumulative_integral(x_vals, y_vals, method)
+    offset = 0.0
+    offset_error = 0.0
+    if anchor is not None and anchor != x_vals[0]:
+        if func is not None:
+            offset, offset_error = quadrature(func, anchor, x_vals[0])
+        elif x_vals[0] <= anchor <= x_vals[-1]:
+            finite = np.isfinite(values)
+            if np.any(finite):
+                offset = -np.interp(anchor, x_vals[finite], values[finite])
+        if not (np.isfinite(offset) and np.isfinite(offset_error)):
+            offset, offset_error = 0.0, 0.0
+
+    # error is cumulative, so its largest value is the estimate over the range
+    return values + offset, float(error[-1] + offset_error)
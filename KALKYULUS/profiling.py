@@ -0,0 +1,107 @@
+"""Per-stage timings and cache counters for one calculation.
+
+The engine wraps its stages in stage() and reports cache lookups with
+count(). Both do nothing unless a Profile has been activated on the current
+thread with profiled(), so uninstrumented calls cost one attribute lookup.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_active = threading.local()
+
+
+class Profile:
+    """Stage timings and cache hits of one run
+
+    Stage times are exclusive: time spent in a nested stage (e.g. evaluation
+    inside adaptive refinement) is only counted for the inner stage, so the
+    stages add up to the total.
+    """
+
+    def __init__(self, label="", **details):
+        self.label = label
+        self.details = details
+        self.started = time.time()
+        self.stages = OrderedDict()
+        self.calls = {}
+        self.counts = OrderedDict()
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        # Each open stage is [name, start, time spent in nested stages]
+        frame = [name, time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed - frame[2]
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {
+            "label": self.label,
+            "started": self.started,
+            "details": self.details,
+            "total": self.total,
+            "stages": {name: {"seconds": seconds, "calls": self.calls[name]} for name, seconds in self.stages.items()},
+            "counts": dict(self.counts)
+        }
+
+    def format(self):
+        """Return a short text summary, one stage per line"""
+        lines = [f"{name:<18}{seconds * 1e3:>9.2f} ms" for name, seconds in self.stages.items()]
+        lines.append(f"{'total':<18}{self.total * 1e3:>9.2f} ms")
+        if self.counts:
+            lines.append(", ".join(f"{name} {value}" for name, value in self.counts.items()))
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiled(profile):
+    """Record stages on this thread into profile; None keeps the current one"""
+    previous = getattr(_active, "profile", None)
+    if profile is not None:
+        _active.profile = profile
+    try:
+        yield profile
+    finally:
+        _active.profile = previous
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage name of the active profile"""
+    profile = getattr(_active, "profile", None)
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def count(name, n=1):
+    """Add n to counter name of the active profile"""
+    profile = getattr(_active, "profile", None)
+    if profile is not None:
+        profile.count(name, n)
+
+
+def export_json(profiles, path):
+    """Write profiles to path as a JSON list"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([profile.as_dict() for profile in profiles], f, indent=2, ensure_ascii=False)
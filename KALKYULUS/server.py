@@ -0,0 +1,412 @@
+"""Serve the calculus engine over local HTTP/JSON so other tools can share one warm cache.
+
+    python server.py --port 8765 --workers 4
+
+POST endpoints take a JSON object and answer with one:
+
+    /parse          {"expr"} -> normalized string, sympy form, parameters, domain
+    /differentiate  {"expr", "order": 1} -> derivatives of orders 0 to order
+    /integrate      {"expr", "timeout": null} -> antiderivative and whether it is closed form
+    /sample         {"expr", "x_min": -10, "x_max": 10, "operations": ["original"], "points": 1000,
+                     "sampling": "uniform", "integral_mode": "auto", "integrate_timeout": null,
+                     "parameters": {}} -> x and one curve per operation, as batch.py writes them
+
+GET /stats reports request counters and the cache statistics of every worker.
+
+Work runs on worker processes, one queue each. Requests are routed by
+normalized expression, so the symbolic results of an expression stay warm
+in one worker, and all workers share the on-disk SymbolicStore. A request
+identical to one still being computed waits for that answer instead of
+being computed again.
+
+/sample answers with binary arrays instead of JSON when the request has
+"format": "binary" or its Accept header is application/octet-stream: a
+4-byte little-endian length, a JSON header of that length (the JSON answer
+without the arrays, plus "arrays", the names of the arrays in order, and
+"length"), then every array as little-endian float64. The arrays are
+written from the result buffers in chunks rather than copied into one body.
+
+The server binds to 127.0.0.1 by default. It has no authentication, so do
+not expose it beyond the machine.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import sympy as sp
+
+import calculus_engine
+import domain
+from batch import Job, evaluate_job, json_values
+
+DEFAULT_PORT = 8765
+MAX_BODY = 1 << 20
+MAX_ORDER = 10
+MAX_POINTS = 10_000_000
+# Bytes written per chunk of a binary response before waiting for the client
+CHUNK_BYTES = 1 << 20
+
+SAMPLE_DEFAULTS = {
+    "x_min": -10.0,
+    "x_max": 10.0,
+    "operations": ["original"],
+    "points": calculus_engine.DEFAULT_NUM_POINTS,
+    "sampling": "uniform",
+    "integral_mode": "auto",
+    "integrate_timeout": None,
+    "parameters": {}
+}
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Jobs run in the worker processes and return picklable dicts
+
+def init_worker(store_path):
+    if store_path is not None:
+        calculus_engine.symbolic_cache.open_store(store_path or None)
+
+
+def parse_job(params):
+    cache = calculus_engine.symbolic_cache
+    entry = cache.get(params["expr"])
+    intervals = entry.domain()
+    cache.persist(entry)
+    return {"expr": entry.func_str, "sympy": str(entry.expr),
+            "parameters": [str(parameter) for parameter in entry.parameters],
+            "domain": None if intervals is None else domain.describe(intervals)}
+
+
+def differentiate_job(params):
+    cache = calculus_engine.symbolic_cache
+    entry = cache.get(params["expr"])
+    derivatives = entry.derivatives.up_to(params["order"])
+    cache.persist(entry)
+    return {"expr": entry.func_str, "derivatives": [str(derivative) for derivative in derivatives]}
+
+
+def integrate_job(params):
+    cache = calculus_engine.symbolic_cache
+    entry = cache.get(params["expr"])
+    integral = entry.integral(params["timeout"])
+    cache.persist(entry)
+    return {"expr": entry.func_str, "integral": str(integral), "closed_form": not integral.has(sp.Integral)}
+
+
+def sample_job(params):
+    options = {key: params[key] for key in ("sampling", "integral_mode", "integrate_timeout", "parameters")}
+    options["num_points"] = params["points"]
+    record = evaluate_job(Job(0, params["expr"], params["x_min"], params["x_max"], params["operations"]), options)
+    del record["index"]
+    return record
+
+
+def stats_job(params):
+    stats = {"symbolic": calculus_engine.symbolic_cache.stats()}
+    store = calculus_engine.symbolic_cache.store
+    if store is not None:
+        stats["store"] = store.stats()
+    return stats
+
+
+JOBS = {"parse": parse_job, "differentiate": differentiate_job, "integrate": integrate_job,
+        "sample": sample_job, "stats": stats_job}
+
+
+def run_job(name, params):
+    """Run a job, returning its error as {"error": message} instead of raising
+
+    Exceptions are not sent back to the server process: some, like
+    ParseError, cannot be unpickled.
+    """
+    try:
+        return JOBS[name](params)
+    except Exception as e:
+        return {"error": str(e)}
+
+
+# Request validation, in the server process
+
+def number(params, key, integer=False):
+    value = params[key]
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+        raise HttpError(400, f"{key} must be {'an integer' if integer else 'a number'}")
+    if not integer and not math.isfinite(value):
+        raise HttpError(400, f"{key} must be finite")
+    return value if integer else float(value)
+
+
+def read_params(endpoint, body):
+    """Return (params, binary): the validated parameters of a request with defaults filled in
+
+    binary is whether the request asks for "format": "binary", which is
+    left out of params so JSON and binary requests are coalesced.
+    """
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError as e:
+        raise HttpError(400, f"Invalid JSON: {e}")
+    if not isinstance(request, dict) or not isinstance(request.get("expr"), str) or not request["expr"].strip():
+        raise HttpError(400, 'Expected a JSON object with an "expr" string')
+
+    params = {"expr": calculus_engine.normalize(request["expr"])}
+    if endpoint == "differentiate":
+        params["order"] = number(dict({"order": 1}, **request), "order", integer=True)
+        if not 0 <= params["order"] <= MAX_ORDER:
+            raise HttpError(400, f"order must be between 0 and {MAX_ORDER}")
+    elif endpoint == "integrate":
+        params["timeout"] = request.get("timeout")
+        if params["timeout"] is not None:
+            params["timeout"] = number(request, "timeout")
+    elif endpoint == "sample":
+        request = dict(SAMPLE_DEFAULTS, **request)
+        params["x_min"] = number(request, "x_min")
+        params["x_max"] = number(request, "x_max")
+        if params["x_min"] >= params["x_max"]:
+            raise HttpError(400, "x_min must be less than x_max")
+        params["points"] = number(request, "points", integer=True)
+        if not 2 <= params["points"] <= MAX_POINTS:
+            raise HttpError(400, f"points must be between 2 and {MAX_POINTS}")
+        operations = request["operations"]
+        if not isinstance(operations, list) or not operations or \
+                not all(operation in calculus_engine.OPERATIONS for operation in operations):
+            raise HttpError(400, "operations must be a list of: " + ", ".join(calculus_engine.OPERATIONS))
+        params["operations"] = operations
+        if request["sampling"] not in ("uniform", "adaptive"):
+            raise HttpError(400, 'sampling must be "uniform" or "adaptive"')
+        if request["integral_mode"] not in calculus_engine.INTEGRAL_MODES:
+            raise HttpError(400, "integral_mode must be one of: " + ", ".join(calculus_engine.INTEGRAL_MODES))
+        params["sampling"] = request["sampling"]
+        params["integral_mode"] = request["integral_mode"]
+        params["integrate_timeout"] = (None if request["integrate_timeout"] is None
+                                       else number(request, "integrate_timeout"))
+        parameters = request["parameters"]
+        if not isinstance(parameters, dict):
+            raise HttpError(400, "parameters must be an object of name: value")
+        params["parameters"] = {name: number(parameters, name) for name in parameters}
+    return params, request.get("format") == "binary"
+
+
+def finite(value):
+    # JSON has no NaN or infinity
+    return value if value is None or math.isfinite(value) else None
+
+
+def json_record(record):
+    """Turn a sample job's arrays into lists for a JSON answer"""
+    if "x" not in record:
+        return record
+    return dict(record, x=json_values(record["x"]), curves={
+        operation: dict(curve, y=json_values(curve["y"]), error_estimate=finite(curve["error_estimate"]))
+        for operation, curve in record["curves"].items()})
+
+
+def binary_layout(record):
+    """Return (header, arrays) of a binary answer: the record without arrays and the arrays in order"""
+    names = ["x"] + [operation for operation, curve in record["curves"].items() if curve["y"] is not None]
+    arrays = [record["x"]] + [record["curves"][name]["y"] for name in names[1:]]
+    header = dict(record, curves={
+        operation: dict({key: value for key, value in curve.items() if key != "y"},
+                        error_estimate=finite(curve["error_estimate"]))
+        for operation, curve in record["curves"].items()})
+    del header["x"]
+    header.update(arrays=names, length=len(record["x"]))
+    return header, [np.ascontiguousarray(array, dtype='<f8') for array in arrays]
+
+
+async def read_request(reader):
+    """Return (method, path, headers, body) of the next request, or None when the client is done"""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HttpError(413, f"Request body is limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method, path.split('?', 1)[0], headers, body
+
+
+def head(status, content_type, length, keep_alive):
+    return (f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {length}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+            ).encode("latin-1")
+
+
+async def send_json(writer, status, value, keep_alive=True):
+    body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    writer.write(head(status, "application/json; charset=utf-8", len(body), keep_alive) + body)
+    await writer.drain()
+
+
+async def send_arrays(writer, record, keep_alive=True):
+    header, arrays = binary_layout(record)
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    length = 4 + len(header) + sum(array.nbytes for array in arrays)
+    writer.write(head(200, "application/octet-stream", length, keep_alive) + struct.pack("<I", len(header)) + header)
+    for array in arrays:
+        view = memoryview(array).cast('B')
+        for start in range(0, len(view), CHUNK_BYTES):
+            writer.write(view[start:start + CHUNK_BYTES])
+            await writer.drain()
+
+
+class ComputeServer:
+    """asyncio HTTP server handing requests to per-worker process pools, with coalescing of identical requests
+
+    store_path is passed to SymbolicCache.open_store in every worker: ""
+    for the user's cache directory, None for no store.
+    """
+
+    def __init__(self, workers=None, store_path=""):
+        self.store_path = store_path
+        self.executors = [self.new_executor() for _ in range(workers or os.cpu_count() or 1)]
+        self.in_flight = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    def new_executor(self):
+        return ProcessPoolExecutor(max_workers=1, initializer=init_worker, initargs=(self.store_path,))
+
+    def worker_index(self, expr):
+        # crc32 rather than hash(), which varies between runs
+        return zlib.crc32(expr.encode("utf-8")) % len(self.executors)
+
+    async def compute(self, endpoint, params):
+        """Run the job for endpoint on the worker owning params["expr"], sharing identical in-flight requests"""
+        key = json.dumps([endpoint, params], sort_keys=True)
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self.run(endpoint, params))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # One client disconnecting must not cancel the others' answer
+        return await asyncio.shield(future)
+
+    async def run(self, endpoint, params):
+        index = self.worker_index(params["expr"])
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.executors[index], run_job, endpoint, params)
+        except BrokenProcessPool:
+            # The worker died (e.g. out of memory); start a new one for later requests
+            self.executors[index] = self.new_executor()
+            raise HttpError(500, "The worker process died while computing this request")
+
+    async def stats(self):
+        loop = asyncio.get_running_loop()
+        workers = await asyncio.gather(*(loop.run_in_executor(executor, run_job, "stats", {})
+                                         for executor in self.executors))
+        return {"requests": self.requests, "coalesced": self.coalesced, "in_flight": len(self.in_flight),
+                "workers": workers}
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    keep_alive = request[2].get("connection", "").lower() != "close"
+                    await self.respond(writer, *request, keep_alive)
+                except HttpError as e:
+                    await send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, method, path, headers, body, keep_alive):
+        endpoint = path.strip('/')
+        if endpoint == "stats":
+            if method != "GET":
+                raise HttpError(405, "Use GET for /stats")
+            await send_json(writer, 200, await self.stats(), keep_alive)
+            return
+        if endpoint not in ("parse", "differentiate", "integrate", "sample"):
+            raise HttpError(404, f"No endpoint {path}")
+        if method != "POST":
+            raise HttpError(405, f"Use POST for {path}")
+
+        self.requests += 1
+        params, binary = read_params(endpoint, body)
+        binary = binary or "application/octet-stream" in headers.get("accept", "")
+        result = await self.compute(endpoint, params)
+        if "error" in result:
+            await send_json(writer, 400, result, keep_alive)
+        elif endpoint == "sample" and binary:
+            await send_arrays(writer, result, keep_alive)
+        elif endpoint == "sample":
+            await send_json(writer, 200, json_record(result), keep_alive)
+        else:
+            await send_json(writer, 200, result, keep_alive)
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(cancel_futures=True)
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, workers=None, store_path=""):
+    compute_server = ComputeServer(workers, store_path)
+    server = await asyncio.start_server(compute_server.handle, host, port)
+    print(f"Serving on http://{host}:{port} with {len(compute_server.executors)} worker(s)", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        compute_server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve parse, differentiate, integrate and sample over HTTP/JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--store", metavar="PATH", default="",
+                        help="symbolic store shared by the workers (default: the user's cache directory)")
+    parser.add_argument("--no-store", action="store_true", help="keep symbolic results in memory only")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, None if args.no_store else args.store))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""Headless engine for functions of two variables, f(x, y).
+
+The partial derivatives, gradient and Hessian are computed symbolically
+once per function string. All requested quantities are then evaluated over
+the grid by one CSE'd kernel, called with x as a row and y as a column so
+NumPy broadcasts it over the grid without building a meshgrid, one band of
+rows at a time. Large grids are decimated for display.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import sympy as sp
+
+import autoscale
+import backends
+from calculus_engine import DEFAULT_PARAMETER_VALUE, normalize, parse_function
+from calculus_operations import SURFACE_LABELS, SURFACE_OPERATIONS
+from profiling import count, profiled, stage
+
+x, y = sp.symbols('x y')
+
+DEFAULT_RESOLUTION = 400
+DEFAULT_CACHE_SIZE = 32
+# Cells per axis of the gradient field drawn as arrows
+DEFAULT_FIELD_RESOLUTION = 24
+# Largest grid shown as an image or surface; bigger grids are decimated
+MAX_IMAGE_CELLS = 1000
+MAX_SURFACE_CELLS = 150
+# Grid cells evaluated per kernel call with NumPy; other backends block and thread internally
+BLOCK_CELLS = 1 << 14
+
+
+class SurfaceEntry:
+    """Parsed f(x, y) with its symbolic partial derivatives, gradient and Hessian
+
+    Symbols other than x and y are parameters, passed to the compiled
+    kernels after x and y as in the single-variable engine.
+    """
+
+    def __init__(self, func_str):
+        self.func_str = func_str
+        self.expr = parse_function(func_str)
+        self.parameters = tuple(sorted(self.expr.free_symbols - {x, y}, key=str))
+        with stage("differentiate"):
+            self.gradient = [sp.diff(self.expr, x), sp.diff(self.expr, y)]
+            self.hessian = sp.hessian(self.expr, (x, y))
+        self.exprs = {
+            "original": self.expr,
+            "partial_x": self.gradient[0],
+            "partial_y": self.gradient[1],
+            "gradient_norm": sp.sqrt(self.gradient[0] ** 2 + self.gradient[1] ** 2),
+            "hessian_det": self.hessian.det()
+        }
+        self._kernels = {}
+        self._lock = threading.Lock()
+
+    def kernel(self, operations):
+        """Return one compiled function of (x, y, *parameters) returning every quantity in operations"""
+        operations = tuple(operations)
+        with self._lock:
+            count("kernel_hits" if operations in self._kernels else "kernel_misses")
+            if operations not in self._kernels:
+                with stage("lambdify"):
+                    self._kernels[operations] = backends.Kernel(
+                        (x, y) + self.parameters, [self.exprs[operation] for operation in operations])
+            return self._kernels[operations]
+
+
+class SurfaceCache:
+    """Bounded LRU cache of SurfaceEntry objects keyed on the normalized function string"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, func_str):
+        key = normalize(func_str)
+        with self._lock:
+            entry = self._entries.get(key)
+            count("symbolic_hits" if entry is not None else "symbolic_misses")
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = SurfaceEntry(key)
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+
+# Shared cache used by calculate_surface() unless another one is passed in
+surface_cache = SurfaceCache()
+
+
+def evaluate_grid(kernel, x_vals, y_vals, values=()):
+    """Evaluate kernel over the grid of x_vals (columns) and y_vals (rows), one float array per output
+
+    With NumPy the grid is evaluated a band of rows at a time into
+    preallocated outputs, so the kernel's temporaries stay small enough for
+    the CPU cache instead of each being a full-grid array. A threaded
+    backend, selected on a first band of backends.MIN_POINTS cells, gets
+    the rest of the grid in one call.
+    """
+    shape = (len(y_vals), len(x_vals))
+    rows = max(1, BLOCK_CELLS // len(x_vals))
+    row = x_vals[np.newaxis, :]
+    outputs = None
+    with stage("evaluate"), np.errstate(all='ignore'):
+        if shape[0] * shape[1] >= backends.MIN_POINTS:
+            trial = -(-backends.MIN_POINTS // shape[1])
+            if kernel.choose(row, y_vals[:trial, np.newaxis], *values) != "numpy":
+                rows = shape[0]
+        for start in range(0, shape[0], rows):
+            band = kernel(row, y_vals[start:start + rows, np.newaxis], *values)
+            if outputs is None:
+                outputs = [np.empty(shape) for _ in band]
+            for output, values_band in zip(outputs, band):
+                # Outputs that do not depend on x or y come back as scalars or single rows
+                output[start:start + rows] = values_band
+    return outputs
+
+
+def decimate(grid, max_cells):
+    """Take every k-th row and column so neither axis has more than max_cells; returns (grid, (row_step, col_step))"""
+    row_step = -(-grid.shape[0] // max_cells)
+    col_step = -(-grid.shape[1] // max_cells)
+    return grid[::row_step, ::col_step], (row_step, col_step)
+
+
+class SurfaceResult:
+    """Everything calculate_surface() produced for one function string and region"""
+
+    def __init__(self, func_str, entry, x_vals, y_vals, grids, parameters, field=None):
+        self.func_str = func_str
+        self.expr = entry.expr
+        self.gradient = entry.gradient
+        self.hessian = entry.hessian
+        self.exprs = {operation: entry.exprs[operation] for operation in grids}
+        self.x_vals = x_vals
+        self.y_vals = y_vals
+        # Operation -> 2D array with one row per y value
+        self.grids = grids
+        self.parameters = parameters
+        # (x, y, dx, dy) of the gradient on a coarse grid, if requested
+        self.field = field
+        self._limits = {}
+
+    def limits(self, operation):
+        """Robust (low, high) color/z limits of one quantity, or None"""
+        if operation not in self._limits:
+            grid, _ = decimate(self.grids[operation], MAX_IMAGE_CELLS)
+            values = grid[np.isfinite(grid)]
+            low_high = tuple(autoscale.quantiles(values, [autoscale.LOW_QUANTILE, autoscale.HIGH_QUANTILE])) \
+                if len(values) else None
+            self._limits[operation] = None if low_high is None or not low_high[0] < low_high[1] else low_high
+        return self._limits[operation]
+
+    def image(self, operation, max_cells=MAX_IMAGE_CELLS):
+        """Return (grid, extent) for showing one quantity as an image, decimated to max_cells per axis"""
+        grid, _ = decimate(self.grids[operation], max_cells)
+        return grid, (self.x_vals[0], self.x_vals[-1], self.y_vals[0], self.y_vals[-1])
+
+    def surface(self, operation, max_cells=MAX_SURFACE_CELLS):
+        """Return (X, Y, Z) for a 3D surface plot of one quantity, decimated to max_cells per axis"""
+        grid, (row_step, col_step) = decimate(self.grids[operation], max_cells)
+        x_mesh, y_mesh = np.meshgrid(self.x_vals[::col_step], self.y_vals[::row_step])
+        return x_mesh, y_mesh, grid
+
+
+def calculate_surface(func_str, x_min, x_max, y_min, y_max, operations=("original",),
+                      resolution=DEFAULT_RESOLUTION, parameters=None, field_resolution=None, cache=None,
+                      profile=None):
+    """Evaluate quantities of f(x, y) from SURFACE_OPERATIONS over a resolution × resolution grid
+
+    resolution may also be an (nx, ny) pair. All quantities come from one
+    fused kernel call. With field_resolution the gradient is also sampled
+    on a coarse grid of that many points per axis for drawing as arrows.
+    parameters maps other symbols to values as in calculus_engine.calculate.
+    """
+    with profiled(profile):
+        if x_min >= x_max or y_min >= y_max:
+            raise ValueError("The minimum of each range must be less than its maximum")
+        unknown = set(operations) - set(SURFACE_OPERATIONS)
+        if unknown:
+            raise ValueError("Unknown surface operations: " + ", ".join(sorted(unknown)))
+        nx, ny = (resolution, resolution) if np.isscalar(resolution) else resolution
+
+        entry = (surface_cache if cache is None else cache).get(func_str)
+        parameters = parameters or {}
+        values = tuple(float(parameters.get(str(symbol), DEFAULT_PARAMETER_VALUE)) for symbol in entry.parameters)
+        requested = [operation for operation in SURFACE_OPERATIONS if operation in operations] or ["original"]
+
+        x_vals = np.linspace(x_min, x_max, nx)
+        y_vals = np.linspace(y_min, y_max, ny)
+        grids = dict(zip(requested, evaluate_grid(entry.kernel(requested), x_vals, y_vals, values)))
+
+        field = None
+        if field_resolution:
+            field_x = np.linspace(x_min, x_max, field_resolution)
+            field_y = np.linspace(y_min, y_max, field_resolution)
+            dx, dy = evaluate_grid(entry.kernel(("partial_x", "partial_y")), field_x, field_y, values)
+            field = (*np.meshgrid(field_x, field_y), dx, dy)
+
+        return SurfaceResult(func_str, entry, x_vals, y_vals, grids,
+                             dict(zip(map(str, entry.parameters), values)), field)
+
+
+def describe(result):
+    """Lines of text with the symbolic gradient and Hessian of a SurfaceResult"""
+    hessian = result.hessian
+    return [f"{SURFACE_LABELS['original']} = {result.expr}",
+            f"∇f = ({result.gradient[0]}, {result.gradient[1]})",
+            f"H = [[{hessian[0, 0]}, {hessian[0, 1]}], [{hessian[1, 0]}, {hessian[1, 1]}]]"]
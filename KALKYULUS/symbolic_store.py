@@ -0,0 +1,173 @@
+"""On-disk store of symbolic results and function history, kept between sessions.
+
+Rows are keyed on the normalized function string, the sympy version and
+whether derivatives were simplified, so an upgrade of sympy never reads
+results pickled by another version. The store is bounded by the total size
+of the pickled rows; the least recently used rows are evicted first.
+
+Only the standard library is imported here, so the history can be read at
+startup before sympy is loaded. The file is a private cache: it is unpickled
+on load, so it must not come from an untrusted source.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+MAX_HISTORY = 100
+# Seconds to wait for another process holding the database lock
+LOCK_TIMEOUT = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    expression TEXT NOT NULL,
+    sympy_version TEXT NOT NULL,
+    simplified INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (expression, sympy_version, simplified)
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+CREATE TABLE IF NOT EXISTS history (
+    function TEXT PRIMARY KEY,
+    last_used REAL NOT NULL
+);
+"""
+
+
+def default_path():
+    """Location of the store in the user's cache directory"""
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "kalkyulus", "symbolic_cache.sqlite3")
+
+
+class SymbolicStore:
+    """SQLite file holding pickled symbolic results and the function history
+
+    Every call opens its own connection, so a store may be shared between
+    threads and several processes may use the same file. Database errors
+    are not raised: a store that cannot be read behaves as empty and one
+    that cannot be written drops the write, so plotting never depends on it.
+    """
+
+    def __init__(self, path=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path or default_path()
+        self.max_bytes = max_bytes
+        self.errors = 0
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        with self._lock:
+            if not self._initialized:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with closing(sqlite3.connect(self.path, timeout=LOCK_TIMEOUT)) as connection:
+                    connection.execute("PRAGMA journal_mode=WAL")
+                    connection.executescript(SCHEMA)
+                self._initialized = True
+        return closing(sqlite3.connect(self.path, timeout=LOCK_TIMEOUT))
+
+    def load(self, expression, sympy_version, simplified=False):
+        """Return the record stored for expression, or None
+
+        A row that can no longer be unpickled is deleted and treated as missing.
+        """
+        key = (expression, sympy_version, int(simplified))
+        try:
+            with self.connect() as connection, connection:
+                row = connection.execute(
+                    "SELECT data FROM results WHERE expression = ? AND sympy_version = ? AND simplified = ?",
+                    key).fetchone()
+                if row is None:
+                    return None
+                try:
+                    record = pickle.loads(row[0])
+                except Exception:
+                    connection.execute(
+                        "DELETE FROM results WHERE expression = ? AND sympy_version = ? AND simplified = ?", key)
+                    return None
+                connection.execute(
+                    "UPDATE results SET last_used = ? WHERE expression = ? AND sympy_version = ? AND simplified = ?",
+                    (time.time(),) + key)
+                return record
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            return None
+
+    def save(self, expression, sympy_version, record, simplified=False):
+        """Store record (any picklable object) for expression, then evict down to max_bytes"""
+        try:
+            data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # Some sympy objects cannot be pickled; they are recomputed next session
+            return False
+        try:
+            with self.connect() as connection, connection:
+                connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                                   (expression, sympy_version, int(simplified), data, len(data), time.time()))
+                self.evict(connection)
+            return True
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            return False
+
+    def evict(self, connection):
+        """Delete the least recently used rows until the total size is within max_bytes"""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        rows = connection.execute("SELECT rowid, size FROM results ORDER BY last_used")
+        doomed = []
+        for rowid, size in rows:
+            if excess <= 0:
+                break
+            doomed.append((rowid,))
+            excess -= size
+        connection.executemany("DELETE FROM results WHERE rowid = ?", doomed)
+
+    def history(self, limit=MAX_HISTORY):
+        """Return the most recently plotted function strings, oldest first"""
+        try:
+            with self.connect() as connection:
+                rows = connection.execute("SELECT function FROM history ORDER BY last_used DESC LIMIT ?",
+                                          (limit,)).fetchall()
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            return []
+        return [row[0] for row in reversed(rows)]
+
+    def add_history(self, function, limit=MAX_HISTORY):
+        """Record function as plotted now, keeping the limit most recent entries"""
+        try:
+            with self.connect() as connection, connection:
+                connection.execute("INSERT OR REPLACE INTO history VALUES (?, ?)", (function, time.time()))
+                connection.execute("DELETE FROM history WHERE function NOT IN "
+                                   "(SELECT function FROM history ORDER BY last_used DESC LIMIT ?)", (limit,))
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+
+    def clear(self):
+        """Delete all stored results and history"""
+        try:
+            with self.connect() as connection, connection:
+                connection.execute("DELETE FROM results")
+                connection.execute("DELETE FROM history")
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+
+    def stats(self):
+        try:
+            with self.connect() as connection:
+                entries, size = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except (sqlite3.Error, OSError):
+            self.errors += 1
+            entries, size = 0, 0
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes, "errors": self.errors}
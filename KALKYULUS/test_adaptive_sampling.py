@@ -0,0 +1,14 @@
+import numpy as np
+
+from adaptive_sampling import adaptive_sample
+
+
+def test_jump_to_an_isolated_value_is_one_discontinuity():
+    # sign(0) is 0, so the curve jumps in both segments around x = 0
+    _, _, discontinuities = adaptive_sample(np.sign, -4.0, 4.0)
+    assert discontinuities == [[0.0]]
+
+
+def test_separate_jumps_are_kept():
+    _, _, discontinuities = adaptive_sample(np.floor, -2.5, 2.5)
+    assert np.allclose(discontinuities[0], [-2.0, -1.0, 0.0, 1.0, 2.0])
@@ -0,0 +1,26 @@
+import io
+
+import batch
+
+DEFAULTS = (-1.0, 1.0, ["original"])
+
+
+def read(*lines):
+    return list(batch.read_jobs(io.StringIO("\n".join(lines)), DEFAULTS))
+
+
+def test_null_range_is_reported_on_its_line():
+    bad, good = read('{"expr": "x", "x_min": null}', "x^2 ; 0 ; 2")
+    assert bad.error is not None
+    assert good.error is None and (good.x_min, good.x_max) == (0.0, 2.0)
+    assert batch.evaluate_job(bad, {})["error"] == bad.error
+
+
+def test_unknown_operations_are_reported_on_their_line():
+    unknown, not_a_list, good = read('{"expr": "x", "operations": ["original", "bogus"]}',
+                                     '{"expr": "x", "operations": "original"}',
+                                     '{"expr": "x", "operations": ["first_derivative"]}')
+    assert "bogus" in unknown.error
+    assert not_a_list.error is not None
+    assert good.error is None and good.operations == ["first_derivative"]
+    assert [job.index for job in (unknown, not_a_list, good)] == [0, 1, 2]
@@ -0,0 +1,30 @@
+import math
+
+import numpy as np
+import pytest
+
+import calculus_engine
+
+
+@pytest.mark.parametrize("func_str, expected", [
+    ("gamma(x)", math.gamma),
+    ("factorial(x)", lambda value: math.gamma(value + 1)),
+    ("x!", lambda value: math.gamma(value + 1)),
+    ("erf(x)", math.erf),
+])
+def test_special_functions_evaluate(func_str, expected):
+    result = calculus_engine.calculate(func_str, 0.5, 4.0, ["original", "first_derivative"], num_points=50,
+                                       cache=calculus_engine.SymbolicCache())
+    original = result.curves["original"]
+    assert original.error is None
+    assert np.allclose(original.y_vals, [expected(value) for value in result.x_vals])
+    derivative = result.curves["first_derivative"]
+    assert derivative.error is None
+    assert np.all(np.isfinite(derivative.y_vals))
+
+
+def test_gamma_is_nan_at_its_poles():
+    func = calculus_engine.make_callable(calculus_engine.parse("gamma(x)"))
+    values = func(np.array([-2.0, -1.0, 0.0, 0.5]))
+    assert np.all(np.isnan(values[:3]))
+    assert np.isclose(values[3], math.sqrt(math.pi))